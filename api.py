@@ -20,6 +20,8 @@ import re
 import secrets
 import urllib.parse
 
+from database import normalize_email, utcnow
+
 # Ed25519 for new token signing
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 
@@ -81,6 +83,13 @@ PRODUCT_VERSIONS = {
 CURRENT_VERSION = "2.6.8"
 MIN_VERSION = "2.6.8"
 
+# Products the client may request, and their display names for error messages
+VALID_PRODUCTS = frozenset({"saints-gen"})
+VALID_PRODUCTS_TEXT = ", ".join(sorted(VALID_PRODUCTS))
+PRODUCT_DISPLAY_NAMES = {
+    "saints-gen": "Saint Gen",
+}
+
 
 def check_version_allowed(product: str, version: str) -> tuple:
     """
@@ -202,7 +211,7 @@ async def verify_license(
             expires_at = row["expires_at"]
             if isinstance(expires_at, str):
                 expires_at = datetime.fromisoformat(expires_at)
-            if expires_at < datetime.utcnow():
+            if expires_at < utcnow():
                 return {"valid": False, "reason": "expired"}
 
             # Check hardware ID binding
@@ -293,16 +302,15 @@ async def auth_discord(request: DiscordAuthRequest):
         raise HTTPException(status_code=400, detail="Invalid Discord ID format")
 
     # Require product parameter - blocks old clients that don't send it
-    valid_products = ["saints-gen"]
     if not requested_product:
         return {
             "success": False,
             "error": "Update required! Please download the latest version from Discord."
         }
-    if requested_product not in valid_products:
+    if requested_product not in VALID_PRODUCTS:
         return {
             "success": False,
-            "error": f"Invalid product. Must be one of: {', '.join(valid_products)}"
+            "error": f"Invalid product. Must be one of: {VALID_PRODUCTS_TEXT}"
         }
 
     # Check version - block old clients that don't send version or are outdated
@@ -329,10 +337,7 @@ async def auth_discord(request: DiscordAuthRequest):
 
             if not row:
                 if requested_product:
-                    product_names = {
-                        "saints-gen": "Saint Gen",
-                    }
-                    product_name = product_names.get(requested_product, requested_product)
+                    product_name = PRODUCT_DISPLAY_NAMES.get(requested_product, requested_product)
                     return {
                         "success": False,
                         "error": f"No active {product_name} subscription found for this Discord ID"
@@ -353,7 +358,8 @@ async def auth_discord(request: DiscordAuthRequest):
             if isinstance(expires_at, str):
                 expires_at = datetime.fromisoformat(expires_at)
 
-            if datetime.utcnow() > expires_at:
+            now = utcnow()
+            if now > expires_at:
                 return {
                     "success": False,
                     "error": "Your subscription has expired"
@@ -376,8 +382,7 @@ async def auth_discord(request: DiscordAuthRequest):
 
                 # If this license has pending_days, activate it now (start the countdown)
                 if pending_days:
-                    from datetime import timedelta
-                    new_expires_at = datetime.utcnow() + timedelta(days=pending_days)
+                    new_expires_at = now + timedelta(days=pending_days)
                     expires_at = new_expires_at  # Update for token generation
                     expires_timestamp = int(new_expires_at.timestamp())
 
@@ -607,7 +612,7 @@ async def shopify_order_webhook(
             await conn.execute(
                 """INSERT INTO purchases (email, customer_name, product, days, order_number)
                    VALUES ($1, $2, $3, $4, $5)""",
-                email.lower().strip(), customer_name, product, days, str(order_number)
+                normalize_email(email), customer_name, product, days, str(order_number)
             )
             print(f"Purchase saved for {email} - Order #{order_number}")
     except Exception as e:
@@ -664,7 +669,7 @@ async def mark_notification_delivered(notification_id: int):
                 """UPDATE shopify_notifications
                    SET delivered = 1, last_attempt_at = $1
                    WHERE id = $2""",
-                datetime.utcnow(), notification_id
+                utcnow(), notification_id
             )
         return {"success": True}
     except Exception as e:
@@ -684,7 +689,7 @@ async def mark_notification_failed(notification_id: int, error: str = None):
                        last_attempt_at = $1,
                        error_message = $2
                    WHERE id = $3""",
-                datetime.utcnow(), error, notification_id
+                utcnow(), error, notification_id
             )
         return {"success": True}
     except Exception as e:
@@ -1060,14 +1065,15 @@ async def start_discord_oauth():
         """, status_code=500)
 
     # Generate state token for CSRF protection
+    now = utcnow()
     state = secrets.token_urlsafe(32)
     _oauth_states[state] = {
         "type": "pre_purchase",
-        "created_at": datetime.utcnow()
+        "created_at": now
     }
 
     # Clean old states (older than 10 minutes)
-    cutoff = datetime.utcnow() - timedelta(minutes=10)
+    cutoff = now - timedelta(minutes=10)
     expired = [k for k, v in _oauth_states.items() if v["created_at"] < cutoff]
     for k in expired:
         del _oauth_states[k]
@@ -1104,16 +1110,17 @@ async def start_discord_link(order: str = None, email: str = None):
         return RedirectResponse(url="/")
 
     # Generate state token for CSRF protection
+    now = utcnow()
     state = secrets.token_urlsafe(32)
     _oauth_states[state] = {
         "type": "post_purchase",
         "order": order,
-        "email": email.lower().strip() if email else None,
-        "created_at": datetime.utcnow()
+        "email": normalize_email(email) if email else None,
+        "created_at": now
     }
 
     # Clean old states (older than 10 minutes)
-    cutoff = datetime.utcnow() - timedelta(minutes=10)
+    cutoff = now - timedelta(minutes=10)
     expired = [k for k, v in _oauth_states.items() if v["created_at"] < cutoff]
     for k in expired:
         del _oauth_states[k]
@@ -1305,12 +1312,21 @@ async def discord_oauth_callback(code: str = None, state: str = None, error: str
     # POST-PURCHASE FLOW: Find pending order and create license
     email = provided_email or discord_email
     try:
-        from database import get_pending_order_by_email, claim_pending_order, add_license
+        from database import get_pending_order_by_email, claim_pending_order_with_license
         from license_crypto import generate_license_key
 
         pending = await get_pending_order_by_email(email) if email else None
 
-        if not pending:
+        result = None
+        if pending:
+            # Claim the order and extend-or-create the license in one transaction: a repeated
+            # callback finds it claimed, and a failed grant leaves it unclaimed for a retry
+            license_key, _ = generate_license_key(SECRET_KEY, discord_id, pending["days"], discord_name)
+            result = await claim_pending_order_with_license(
+                pending["id"], license_key, discord_id, discord_name, pending["days"], pending["product"]
+            )
+
+        if not result:
             return HTMLResponse(f"""
                 <html><body style="font-family: Arial; padding: 40px; text-align: center; background: #0a0a0f; color: #fff;">
                     <h1>No Order Found</h1>
@@ -1321,20 +1337,10 @@ async def discord_oauth_callback(code: str = None, state: str = None, error: str
             """)
 
         product = pending["product"]
-        days = pending["days"]
         order_number = pending.get("order_number", "Unknown")
+        expires_at, _ = result
 
-        # Generate license
-        expires_at = datetime.utcnow() + timedelta(days=days)
-        license_key, _ = generate_license_key(SECRET_KEY, discord_id, days, discord_name)
-
-        # Add to database
-        await add_license(license_key, discord_id, discord_name, expires_at, product)
-
-        # Mark as claimed
-        await claim_pending_order(pending["id"], discord_id)
-
-        prod_name = "Saint Gen"
+        prod_name = PRODUCT_DISPLAY_NAMES.get(product, product)
 
         return HTMLResponse(f"""
             <html>
@@ -6,34 +6,162 @@ import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 import asyncio
+import calendar
+import logging
 import os
+import threading
 import time
 from datetime import datetime, timedelta
 from typing import Optional
 import math
 
 import aiohttp
+import uvicorn
 
 from config import DISCORD_TOKEN, ADMIN_IDS, HELPER_IDS, SECRET_KEY, GUILD_ID, SUBSCRIBER_ROLE_ID, STORE_URL
 from database import (
-    init_db, add_license, get_license_by_key, get_license_by_user,
+    init_db, get_license_by_key, get_license_by_user,
     revoke_license, revoke_user_licenses,
     extend_license, extend_user_license, get_all_active_licenses, get_license_stats,
     reset_hwid_by_user,
-    get_newly_expired_licenses, mark_expiry_notified, has_active_license,
-    has_active_license_for_product, close_pool, init_notifications_table,
-    get_pending_notifications, get_failed_notifications,
+    get_newly_expired_licenses, mark_expiry_notified_bulk, has_active_license,
+    get_active_license_pairs, close_pool, init_notifications_table,
+    get_pending_notifications, get_failed_notifications, count_notifications,
     extend_user_license_for_product, init_linked_accounts_table,
     init_purchases_table, redeem_by_email, get_all_licenses_for_user,
-    get_licenses_expiring_soon, mark_warning_notified
+    get_licenses_expiring_soon, mark_warning_notified,
+    mark_notifications_delivered_bulk, mark_notifications_failed_bulk, utcnow,
+    upsert_license_extending, get_pool, get_pool_stats
 )
 from license_crypto import generate_license_key, get_key_info
+from api import app
+
+log = logging.getLogger(__name__)
+
+
+def _as_dt(value) -> datetime:
+    """Return value as a datetime, parsing ISO strings (asyncpg already gives datetimes)."""
+    return value if value.__class__ is datetime else datetime.fromisoformat(value)
+
+
+# Month names resolved once (calendar's sequences re-run strftime on every index)
+MONTH_ABBR = calendar.month_abbr[:]
+MONTH_NAMES = calendar.month_name[:]
+
+
+def format_short_date(dt: datetime) -> str:
+    """Format as e.g. 'Mar 05, 2025' (same as strftime('%b %d, %Y'))."""
+    return f"{MONTH_ABBR[dt.month]} {dt.day:02d}, {dt.year}"
+
+
+def format_long_date(dt: datetime) -> str:
+    """Format as e.g. 'March 05, 2025' (same as strftime('%B %d, %Y'))."""
+    return f"{MONTH_NAMES[dt.month]} {dt.day:02d}, {dt.year}"
+
+
+async def _resolve_member(guild: discord.Guild, user_id: int) -> discord.Member:
+    """Fetch a guild member over REST (raises NotFound if not in guild).
+
+    The member cache is disabled (MemberCacheFlags.none()), so there is no cache to try first.
+    """
+    return await guild.fetch_member(user_id)
+
+
+async def _guild_member(guild: discord.Guild, user) -> discord.Member:
+    """The interaction's Member if it belongs to `guild`, else fetch it there.
+
+    Commands are synced globally, so an interaction Member may come from another guild.
+    """
+    if isinstance(user, discord.Member) and user.guild.id == guild.id:
+        return user
+    return await _resolve_member(guild, user.id)
+
+
+def _has_role(member: discord.Member, role: discord.Role) -> bool:
+    """Role membership via the member's sorted role-id list (binary search, no Role list build)."""
+    return member.get_role(role.id) is not None
+
+
+def _expiry_thresholds(now: datetime) -> tuple:
+    """Expiry cutoffs for the status emoji: on/after these means more than 30 / 7 full days left."""
+    return now + timedelta(days=31), now + timedelta(days=8)
+
+
+def _best_licenses_by_product(licenses: list) -> tuple:
+    """Single pass over a user's licenses (expires_at already datetimes).
+
+    Returns ({product: non-revoked license with the latest expiry}, {products with any license}).
+    """
+    best = {}
+    seen = set()
+    for lic in licenses:
+        prod = lic.get("product")
+        seen.add(prod)
+        if lic.get("revoked"):
+            continue
+        current = best.get(prod)
+        if current is None or lic["expires_at"] > current["expires_at"]:
+            best[prod] = lic
+    return best, seen
 
 
 # ==================== SELF-SERVICE HWID RESET (View must be defined before bot) ====================
 
 HWID_RESET_CHANNEL_ID = 1484207790279884952
 
+# Time deducted per self-service reset (also the minimum remaining to allow one)
+HWID_RESET_COST = timedelta(hours=6)
+
+# Local license API (served by run_api in this process)
+API_PORT = int(os.getenv("PORT", 8080))
+API_BASE_URL = f"http://localhost:{API_PORT}"
+
+# Max Shopify notifications handled at once (keeps Discord rate limits happy)
+NOTIFICATION_CONCURRENCY = 5
+
+# How often the Shopify notification queue is polled
+NOTIFICATION_POLL_SECONDS = 10
+
+# Max concurrent DM sends across all background loops
+DM_CONCURRENCY = 5
+
+# Workers draining the fire-and-forget DM queue used by slash commands
+DM_QUEUE_WORKERS = 4
+
+# Static replies for the HWID reset button - built once, never mutated
+HWID_NO_LICENSE_EMBED = discord.Embed.from_dict({
+    "title": "No License Found",
+    "description": "You don't have an active **Saint Gen** license.",
+    "color": discord.Color.red().value,
+    "fields": [
+        {"name": "Need Access?", "value": "Visit https://saintservice.store/ to purchase a subscription!", "inline": False},
+    ],
+})
+
+HWID_REVOKED_EMBED = discord.Embed.from_dict({
+    "title": "License Revoked",
+    "description": "Your license has been revoked. Please contact support.",
+    "color": discord.Color.red().value,
+})
+
+HWID_EXPIRED_EMBED = discord.Embed.from_dict({
+    "title": "License Expired",
+    "description": "Your license has expired.",
+    "color": discord.Color.red().value,
+    "fields": [
+        {"name": "Renew", "value": "Visit https://saintservice.store/ to renew your subscription!", "inline": False},
+    ],
+})
+
+HWID_NOT_BOUND_EMBED = discord.Embed.from_dict({
+    "title": "No HWID Bound",
+    "description": "Your license isn't bound to any PC yet. No reset needed!",
+    "color": discord.Color.blue().value,
+    "fields": [
+        {"name": "How to Activate", "value": "Simply open Saint Gen and enter your Discord ID to activate.", "inline": False},
+    ],
+})
+
 
 class HWIDResetView(discord.ui.View):
     """Persistent view for self-service HWID reset button."""
@@ -58,53 +186,26 @@ class HWIDResetView(discord.ui.View):
         license_info = await get_license_by_user(discord_id, product)
 
         if not license_info:
-            embed = discord.Embed(
-                title="No License Found",
-                description="You don't have an active **Saint Gen** license.",
-                color=discord.Color.red()
-            )
-            embed.add_field(
-                name="Need Access?",
-                value=f"Visit https://saintservice.store/ to purchase a subscription!",
-                inline=False
-            )
-            await interaction.followup.send(embed=embed, ephemeral=True)
+            await interaction.followup.send(embed=HWID_NO_LICENSE_EMBED, ephemeral=True)
             return
 
         if license_info.get("revoked"):
-            embed = discord.Embed(
-                title="License Revoked",
-                description="Your license has been revoked. Please contact support.",
-                color=discord.Color.red()
-            )
-            await interaction.followup.send(embed=embed, ephemeral=True)
+            await interaction.followup.send(embed=HWID_REVOKED_EMBED, ephemeral=True)
             return
 
         # Check if license is expired
-        expires_at = license_info["expires_at"]
-        if isinstance(expires_at, str):
-            expires_at = datetime.fromisoformat(expires_at)
+        expires_at = _as_dt(license_info["expires_at"])
 
-        now = datetime.utcnow()
+        now = utcnow()
         if expires_at <= now:
-            embed = discord.Embed(
-                title="License Expired",
-                description="Your license has expired.",
-                color=discord.Color.red()
-            )
-            embed.add_field(
-                name="Renew",
-                value=f"Visit https://saintservice.store/ to renew your subscription!",
-                inline=False
-            )
-            await interaction.followup.send(embed=embed, ephemeral=True)
+            await interaction.followup.send(embed=HWID_EXPIRED_EMBED, ephemeral=True)
             return
 
         # Check if they have enough time remaining (need at least 6 hours)
         time_remaining = expires_at - now
-        hours_remaining = time_remaining.total_seconds() / 3600
 
-        if hours_remaining < 6:
+        if time_remaining < HWID_RESET_COST:
+            hours_remaining = time_remaining.total_seconds() / 3600
             embed = discord.Embed(
                 title="Not Enough Time",
                 description="You need at least **6 hours** remaining on your license to use self-service HWID reset.",
@@ -126,25 +227,14 @@ class HWIDResetView(discord.ui.View):
         # Check if HWID is even bound
         current_hwid = license_info.get("hwid")
         if not current_hwid:
-            embed = discord.Embed(
-                title="No HWID Bound",
-                description="Your license isn't bound to any PC yet. No reset needed!",
-                color=discord.Color.blue()
-            )
-            embed.add_field(
-                name="How to Activate",
-                value="Simply open Saint Gen and enter your Discord ID to activate.",
-                inline=False
-            )
-            await interaction.followup.send(embed=embed, ephemeral=True)
+            await interaction.followup.send(embed=HWID_NOT_BOUND_EMBED, ephemeral=True)
             return
 
         # Reset HWID and deduct 6 hours
-        from database import get_pool
         pool = await get_pool()
         async with pool.acquire() as conn:
             # Deduct 6 hours and reset HWID
-            new_expiry = expires_at - timedelta(hours=6)
+            new_expiry = expires_at - HWID_RESET_COST
             await conn.execute(
                 """UPDATE licenses
                    SET hwid = NULL, expires_at = $1
@@ -153,7 +243,8 @@ class HWIDResetView(discord.ui.View):
             )
 
         # Calculate new time remaining
-        new_hours_remaining = (new_expiry - now).total_seconds() / 3600
+        new_remaining = time_remaining - HWID_RESET_COST
+        new_hours_remaining = new_remaining.total_seconds() / 3600
         new_days_remaining = new_hours_remaining / 24
 
         # Success response
@@ -194,7 +285,7 @@ class HWIDResetView(discord.ui.View):
                     title="Self-Service HWID Reset",
                     description=f"{interaction.user.mention} reset their own HWID",
                     color=discord.Color.orange(),
-                    timestamp=datetime.utcnow()
+                    timestamp=discord.utils.utcnow()
                 )
                 audit_embed.set_author(name=interaction.user.display_name, icon_url=interaction.user.display_avatar.url)
                 audit_embed.add_field(name="User", value=f"{interaction.user} (`{interaction.user.id}`)", inline=True)
@@ -204,9 +295,9 @@ class HWIDResetView(discord.ui.View):
                 audit_embed.set_footer(text=f"User ID: {interaction.user.id}")
                 await audit_channel.send(embed=audit_embed)
         except Exception as e:
-            print(f"Failed to send audit log: {e}")
+            log.error("Failed to send audit log: %s", e)
 
-        print(f"[HWID] Self-service reset by {interaction.user} ({interaction.user.id}) - 6 hours deducted")
+        log.info("[HWID] Self-service reset by %s (%s) - 6 hours deducted", interaction.user, interaction.user.id)
 
 
 class LicenseBot(commands.Bot):
@@ -214,7 +305,21 @@ class LicenseBot(commands.Bot):
         intents = discord.Intents.default()
         intents.members = True  # Needed to fetch member info
         intents.message_content = True  # Needed to read message content for auto-help
-        super().__init__(command_prefix="!", intents=intents)
+        # Don't keep every guild member resident; members are fetched on demand instead
+        super().__init__(
+            command_prefix="!",
+            intents=intents,
+            member_cache_flags=discord.MemberCacheFlags.none(),
+            chunk_guilds_at_startup=False
+        )
+        # Guild and per-product roles, resolved once in on_ready
+        self._guild: Optional[discord.Guild] = None
+        self._roles: dict = {}
+        # Shared session for calls to the local API (created in setup_hook)
+        self.http_session: Optional[aiohttp.ClientSession] = None
+        # Background DM delivery (workers started in setup_hook)
+        self._dm_queue: Optional[asyncio.Queue] = None
+        self._dm_workers: list = []
 
     async def setup_hook(self):
         # Initialize database
@@ -222,6 +327,16 @@ class LicenseBot(commands.Bot):
         await init_notifications_table()
         await init_linked_accounts_table()
         await init_purchases_table()
+        # One keep-alive session for the local API, reused by every poll
+        self.http_session = aiohttp.ClientSession(
+            base_url=API_BASE_URL,
+            connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=75)
+        )
+        # Shared cap on outgoing DMs so bursts don't trip Discord's rate limits
+        self._dm_sem = asyncio.Semaphore(DM_CONCURRENCY)
+        # DMs queued by slash commands are sent off the request path
+        self._dm_queue = asyncio.Queue()
+        self._dm_workers = [asyncio.create_task(self._dm_worker()) for _ in range(DM_QUEUE_WORKERS)]
         # Register persistent views (must be done before sync)
         self.add_view(HWIDResetView())
         # Sync slash commands globally and to specific guild for instant availability
@@ -242,12 +357,75 @@ class LicenseBot(commands.Bot):
         print(f"Admin IDs: {ADMIN_IDS}")
         print(f"Guild ID: {GUILD_ID}")
         print(f"Subscriber Role ID: {SUBSCRIBER_ROLE_ID}")
+        pool_stats = get_pool_stats()
+        print(f"DB pool: {pool_stats['size']} connections ({pool_stats['idle']} idle)")
         print("------")
+        # Cache the guild and product roles for the command handlers
+        if GUILD_ID:
+            self._guild = self.get_guild(GUILD_ID)
+            self._cache_roles()
         # Update status message on startup
         await update_status_message()
 
+    def _cache_roles(self):
+        """(Re)resolve the per-product roles from the cached guild."""
+        if self._guild:
+            self._roles = {
+                product: self._guild.get_role(PRODUCT_ROLE_IDS.get(product, SUBSCRIBER_ROLE_ID))
+                for product in PRODUCTS
+            }
+
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if self._guild and after.guild.id == self._guild.id:
+            self._cache_roles()
+
+    async def on_guild_role_delete(self, role: discord.Role):
+        if self._guild and role.guild.id == self._guild.id:
+            self._cache_roles()
+
+    def get_product_role(self, product: str) -> Optional[discord.Role]:
+        """Role granted for a product, from the on_ready cache when possible."""
+        role = self._roles.get(product)
+        if role is None and self._guild:
+            role = self._guild.get_role(PRODUCT_ROLE_IDS.get(product, SUBSCRIBER_ROLE_ID))
+        return role
+
+    async def _query_members(self, guild: discord.Guild, user_ids: set) -> Optional[dict]:
+        """Fetch guild members by ID in chunks of 100 over the gateway.
+
+        Returns {user_id: Member} (users not in the guild are absent), or None if the query failed.
+        """
+        user_ids = list(user_ids)
+        members = {}
+        try:
+            for i in range(0, len(user_ids), 100):
+                chunk = user_ids[i:i + 100]
+                for member in await guild.query_members(user_ids=chunk, limit=len(chunk), cache=False):
+                    members[member.id] = member
+        except Exception as e:
+            log.warning("Bulk member query failed, falling back to per-member lookups: %s", e)
+            return None
+        return members
+
+    def queue_dm(self, user, embed: discord.Embed):
+        """Send a DM in the background; the caller doesn't wait for Discord."""
+        self._dm_queue.put_nowait((user, embed))
+
+    async def _dm_worker(self):
+        while True:
+            user, embed = await self._dm_queue.get()
+            try:
+                async with self._dm_sem:
+                    await _safe_dm(user, embed)
+            finally:
+                self._dm_queue.task_done()
+
     async def close(self):
         """Clean up resources when bot shuts down."""
+        for worker in self._dm_workers:
+            worker.cancel()
+        if self.http_session:
+            await self.http_session.close()
         await close_pool()
         await super().close()
 
@@ -260,71 +438,90 @@ class LicenseBot(commands.Bot):
             return  # Role management not configured
 
         try:
-            guild = self.get_guild(GUILD_ID)
-            if not guild:
-                print(f"Could not find guild {GUILD_ID}")
+            # Get newly expired licenses; most ticks have none, so skip the rest
+            expired = await get_newly_expired_licenses(now=utcnow())
+            if not expired:
                 return
 
-            # Get newly expired licenses
-            expired = await get_newly_expired_licenses()
-
-            for lic in expired:
-                discord_id = lic["discord_id"]
-                product = lic.get("product", "saints-gen")
+            guild = self._guild or self.get_guild(GUILD_ID)
+            if not guild:
+                log.warning("Could not find guild %s", GUILD_ID)
+                return
 
-                # Determine which role to check based on product
-                role_id = get_role_id_for_product(product)
-                product_name = get_product_name(product)
+            # Resolve affected members up front: one gateway request per 100 users
+            members = await self._query_members(guild, {int(lic["discord_id"]) for lic in expired})
 
-                if not role_id:
-                    # Mark as notified and skip if role not configured
-                    await mark_expiry_notified(lic["license_key"])
-                    continue
+            # Users who still hold another active license for the product keep their role
+            still_active_pairs = await get_active_license_pairs(
+                list({(lic["discord_id"], lic.get("product", "saints-gen")) for lic in expired})
+            )
 
-                role = guild.get_role(role_id)
-                if not role:
-                    print(f"Could not find role {role_id} for {product}")
-                    await mark_expiry_notified(lic["license_key"])
-                    continue
+            # Keys handled this pass, marked notified in one write at the end
+            notified_keys = []
+            try:
+                for lic in expired:
+                    discord_id = lic["discord_id"]
+                    product = lic.get("product", "saints-gen")
+
+                    # Determine which role to check based on product
+                    role_id = PRODUCT_ROLE_IDS.get(product, SUBSCRIBER_ROLE_ID)
+                    product_name = PRODUCT_NAMES.get(product, product)
+
+                    if not role_id:
+                        # Mark as notified and skip if role not configured
+                        notified_keys.append(lic["license_key"])
+                        continue
+
+                    role = self.get_product_role(product)
+                    if not role:
+                        log.warning("Could not find role %s for %s", role_id, product)
+                        notified_keys.append(lic["license_key"])
+                        continue
+
+                    # Check if user has any other active licenses for this product
+                    if (discord_id, product) not in still_active_pairs:
+                        # Remove role from user
+                        try:
+                            if members is not None:
+                                member = members.get(int(discord_id))
+                                if member is None:
+                                    log.warning("Member %s not found in guild", discord_id)
+                            else:
+                                member = await _resolve_member(guild, int(discord_id))
+                            if member and _has_role(member, role):
+                                await member.remove_roles(role, reason=f"{product_name} license expired")
+                                log.info("Removed %s role from %s (license expired)", product_name, member)
+
+                                # DM the user
+                                try:
+                                    embed = discord.Embed(
+                                        title="Subscription Expired",
+                                        description=f"Your {product_name} license has expired.",
+                                        color=discord.Color.red()
+                                    )
+                                    embed.add_field(
+                                        name="Renew Your Subscription",
+                                        value=f"To continue using {product_name}, please renew your subscription at:\n{STORE_URL}",
+                                        inline=False
+                                    )
+                                    embed.set_footer(text=f"Thank you for using {product_name}!")
+                                    async with self._dm_sem:
+                                        await member.send(embed=embed)
+                                    log.info("Sent expiry DM to %s", member)
+                                except discord.Forbidden:
+                                    log.warning("Could not DM %s (DMs disabled)", member)
+                        except discord.NotFound:
+                            log.warning("Member %s not found in guild", discord_id)
+                        except Exception as e:
+                            log.error("Error processing expired license for %s: %s", discord_id, e)
 
-                # Check if user has any other active licenses for this product
-                still_active = await has_active_license_for_product(discord_id, product)
-
-                if not still_active:
-                    # Remove role from user
-                    try:
-                        member = await guild.fetch_member(int(discord_id))
-                        if member and role in member.roles:
-                            await member.remove_roles(role, reason=f"{product_name} license expired")
-                            print(f"Removed {product_name} role from {member} (license expired)")
-
-                            # DM the user
-                            try:
-                                embed = discord.Embed(
-                                    title="Subscription Expired",
-                                    description=f"Your {product_name} license has expired.",
-                                    color=discord.Color.red()
-                                )
-                                embed.add_field(
-                                    name="Renew Your Subscription",
-                                    value=f"To continue using {product_name}, please renew your subscription at:\n{STORE_URL}",
-                                    inline=False
-                                )
-                                embed.set_footer(text=f"Thank you for using {product_name}!")
-                                await member.send(embed=embed)
-                                print(f"Sent expiry DM to {member}")
-                            except discord.Forbidden:
-                                print(f"Could not DM {member} (DMs disabled)")
-                    except discord.NotFound:
-                        print(f"Member {discord_id} not found in guild")
-                    except Exception as e:
-                        print(f"Error processing expired license for {discord_id}: {e}")
-
-                # Mark as notified regardless
-                await mark_expiry_notified(lic["license_key"])
+                    # Mark as notified regardless
+                    notified_keys.append(lic["license_key"])
+            finally:
+                await mark_expiry_notified_bulk(notified_keys)
 
         except Exception as e:
-            print(f"Error in check_expired_licenses: {e}")
+            log.error("Error in check_expired_licenses: %s", e)
 
     @check_expired_licenses.before_loop
     async def before_check_expired(self):
@@ -342,16 +539,14 @@ class LicenseBot(commands.Bot):
             # Get licenses expiring within 3 days
             expiring = await get_licenses_expiring_soon(days=3)
 
+            now = utcnow()
             for lic in expiring:
                 discord_id = lic["discord_id"]
                 product = lic.get("product", "saints-gen")
-                expires_at = lic["expires_at"]
-                product_name = get_product_name(product)
+                expires_at = _as_dt(lic["expires_at"])
+                product_name = PRODUCT_NAMES.get(product, product)
 
                 # Calculate days remaining
-                now = datetime.utcnow()
-                if isinstance(expires_at, str):
-                    expires_at = datetime.fromisoformat(expires_at)
                 days_left = (expires_at - now).days
 
                 # Try to DM the user
@@ -365,7 +560,7 @@ class LicenseBot(commands.Bot):
                         )
                         embed.add_field(
                             name="Expires On",
-                            value=expires_at.strftime("%B %d, %Y"),
+                            value=format_long_date(expires_at),
                             inline=True
                         )
                         embed.add_field(
@@ -374,167 +569,190 @@ class LicenseBot(commands.Bot):
                             inline=False
                         )
                         embed.set_footer(text="Renew before expiration to keep your access!")
-                        await user.send(embed=embed)
-                        print(f"Sent expiry warning to {user} for {product_name}")
+                        async with self._dm_sem:
+                            await user.send(embed=embed)
+                        log.info("Sent expiry warning to %s for %s", user, product_name)
                 except discord.Forbidden:
-                    print(f"Could not DM user {discord_id} (DMs disabled)")
+                    log.warning("Could not DM user %s (DMs disabled)", discord_id)
                 except discord.NotFound:
-                    print(f"User {discord_id} not found")
+                    log.warning("User %s not found", discord_id)
                 except Exception as e:
-                    print(f"Error sending warning to {discord_id}: {e}")
+                    log.error("Error sending warning to %s: %s", discord_id, e)
 
                 # Mark as warned regardless
                 await mark_warning_notified(lic["license_key"])
 
         except Exception as e:
-            print(f"Error in check_expiring_soon: {e}")
+            log.error("Error in check_expiring_soon: %s", e)
 
     @check_expiring_soon.before_loop
     async def before_check_expiring(self):
         await self.wait_until_ready()
 
-    @tasks.loop(seconds=10)
+    @tasks.loop(seconds=NOTIFICATION_POLL_SECONDS)
     async def process_shopify_notifications(self):
         """Background task to process pending Shopify order notifications."""
         await self.wait_until_ready()
+        await self._drain_notifications()
 
+    async def _drain_notifications(self):
+        """Fetch pending Shopify notifications from the API and deliver them."""
         try:
             # Get pending notifications from the API (now stored in database!)
-            port = int(os.getenv("PORT", 8080))
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"http://localhost:{port}/shopify/pending") as resp:
-                    if resp.status != 200:
-                        return
-                    data = await resp.json()
+            async with self.http_session.get("/shopify/pending") as resp:
+                if resp.status != 200:
+                    return
+                data = await resp.json()
 
             notifications = data.get("notifications", [])
+            if not notifications:
+                return  # Nothing queued; skip the fan-out and status writes
 
-            for notif in notifications:
-                notification_id = notif.get("id")  # Database ID for tracking
-                discord_id = notif.get("discord_id")
-                license_key = notif.get("license_key")
-                expires_at = notif.get("expires_at")
-                product = notif.get("product", "saints-gen")
-                customer_name = notif.get("customer_name", "Customer")
-                order_number = notif.get("order_number", "Unknown")
-
-                product_name = get_product_name(product)
-                print(f"[NOTIF] Processing order #{order_number}: discord_id={discord_id}, product={product}")
-
-                # Try to find the user and assign role
-                user = None
-                role_added = False
-                delivery_success = False
-                error_message = None
-
-                # Check if discord_id is numeric (user ID) or username
-                if discord_id and discord_id.isdigit():
-                    try:
-                        user = await self.fetch_user(int(discord_id))
-                        print(f"[NOTIF] Found Discord user: {user} (ID: {user.id})")
-                    except discord.NotFound:
-                        error_message = f"User not found: {discord_id}"
-                        print(f"[NOTIF] Could not find user with ID {discord_id}")
-                    except Exception as e:
-                        error_message = str(e)
-                        print(f"[NOTIF] Error fetching user {discord_id}: {e}")
-                else:
-                    error_message = f"Invalid Discord ID format: {discord_id}"
-                    print(f"[NOTIF] Invalid Discord ID format: {discord_id}")
-
-                # Assign role if we have guild configured
-                if user and GUILD_ID:
-                    role_id = get_role_id_for_product(product)
-                    print(f"[NOTIF] Attempting role assignment: GUILD_ID={GUILD_ID}, role_id={role_id}")
-                    if role_id:
-                        try:
-                            guild = self.get_guild(GUILD_ID)
-                            if guild:
-                                print(f"[NOTIF] Found guild: {guild.name}")
-                                member = await guild.fetch_member(user.id)
-                                role = guild.get_role(role_id)
-                                print(f"[NOTIF] Member: {member}, Role: {role}")
-                                if member and role and role not in member.roles:
-                                    await member.add_roles(role, reason=f"Shopify order #{order_number}")
-                                    role_added = True
-                                    print(f"[NOTIF] SUCCESS: Added {product_name} role to {user}")
-                                elif member and role and role in member.roles:
-                                    print(f"[NOTIF] User already has the role")
-                                    role_added = True  # Already has it
-                            else:
-                                print(f"[NOTIF] Could not find guild with ID {GUILD_ID}")
-                        except discord.NotFound:
-                            print(f"[NOTIF] User {discord_id} not in guild (NotFound)")
-                        except Exception as e:
-                            print(f"[NOTIF] Error adding role to {discord_id}: {e}")
-                    else:
-                        print(f"[NOTIF] No role_id configured for {product}")
-                else:
-                    if not user:
-                        print(f"[NOTIF] No user found, skipping role assignment")
-                    if not GUILD_ID:
-                        print(f"[NOTIF] GUILD_ID not configured")
-
-                # Send DM with activation instructions
-                if user:
-                    try:
-                        embed = discord.Embed(
-                            title=f"Your {product_name} License",
-                            description=f"Thank you for your purchase! Order #{order_number}",
-                            color=discord.Color.green()
-                        )
-                        embed.add_field(
-                            name="Your Discord ID",
-                            value=f"```{discord_id}```",
-                            inline=False
-                        )
-                        embed.add_field(
-                            name="Expires",
-                            value=expires_at.split("T")[0] if "T" in str(expires_at) else str(expires_at),
-                            inline=True
-                        )
-                        embed.add_field(
-                            name="How to Activate",
-                            value=f"1. Open {product_name}\n2. Enter your Discord ID when prompted\n3. Click Activate",
-                            inline=False
-                        )
-                        if role_added:
-                            embed.set_footer(text=f"Your {product_name} role has been added!")
-
-                        await user.send(embed=embed)
-                        print(f"Sent license DM to {user} for order #{order_number}")
-                        delivery_success = True
-                    except discord.Forbidden:
-                        error_message = "DMs disabled"
-                        print(f"Could not DM {user} (DMs disabled)")
-                        # Still mark as success since the license exists and role was added
-                        delivery_success = True  # License is in DB, they can use /mykey
-                    except Exception as e:
-                        error_message = str(e)
-                        print(f"Error sending DM to {user}: {e}")
+            # Overlap Discord I/O across notifications, bounded to avoid rate-limit thrash
+            sem = asyncio.Semaphore(NOTIFICATION_CONCURRENCY)
+
+            async def guarded(notif):
+                async with sem:
+                    return await self._handle_notif(notif)
+
+            results = await asyncio.gather(*(guarded(n) for n in notifications), return_exceptions=True)
+
+            # Record the outcomes and write them in bulk
+            delivered_ids = []
+            failed = []
+            for result in results:
+                if isinstance(result, Exception):
+                    log.error("Error processing Shopify notification: %s", result)
+                    continue
+                notification_id, delivered, error_message = result
+                if not notification_id:
+                    continue
+                if delivered:
+                    delivered_ids.append(notification_id)
                 else:
-                    print(f"Could not deliver license for order #{order_number} - Discord user not found: {discord_id}")
-
-                # Mark notification as delivered or failed in the database
-                if notification_id:
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            if delivery_success:
-                                await session.post(f"http://localhost:{port}/shopify/notification/{notification_id}/delivered")
-                                print(f"Marked notification {notification_id} as delivered")
-                            else:
-                                await session.post(
-                                    f"http://localhost:{port}/shopify/notification/{notification_id}/failed",
-                                    params={"error": error_message or "Unknown error"}
-                                )
-                                print(f"Marked notification {notification_id} as failed: {error_message}")
-                    except Exception as e:
-                        print(f"Error updating notification status: {e}")
+                    failed.append((notification_id, error_message or "Unknown error"))
+
+            # Mark notifications as delivered or failed in the database
+            try:
+                await asyncio.gather(
+                    mark_notifications_delivered_bulk(delivered_ids),
+                    mark_notifications_failed_bulk(failed)
+                )
+                if delivered_ids or failed:
+                    log.info("Marked %d notification(s) delivered, %d failed", len(delivered_ids), len(failed))
+            except Exception as e:
+                log.error("Error updating notification status: %s", e)
 
         except aiohttp.ClientError:
             pass  # API not ready yet, will retry
         except Exception as e:
-            print(f"Error processing Shopify notifications: {e}")
+            log.error("Error processing Shopify notifications: %s", e)
+
+    async def _handle_notif(self, notif: dict) -> tuple:
+        """Assign the role and DM the buyer for one notification. Returns (id, delivered, error)."""
+        notification_id = notif.get("id")  # Database ID for tracking
+        discord_id = notif.get("discord_id")
+        license_key = notif.get("license_key")
+        expires_at = notif.get("expires_at")
+        product = notif.get("product", "saints-gen")
+        customer_name = notif.get("customer_name", "Customer")
+        order_number = notif.get("order_number", "Unknown")
+
+        product_name = PRODUCT_NAMES.get(product, product)
+        log.debug("[NOTIF] Processing order #%s: discord_id=%s, product=%s", order_number, discord_id, product)
+
+        # Resolve the buyer through the guild when possible (a Member gets the role and can be
+        # DM'd directly); buyers outside the guild, or with no guild configured, still get the DM
+        user = None
+        member = None
+        role_added = False
+        delivery_success = False
+        error_message = None
+
+        if discord_id and discord_id.isdigit():  # numeric user ID, not a username
+            guild = (self._guild or self.get_guild(GUILD_ID)) if GUILD_ID else None
+            if guild:
+                try:
+                    member = await _resolve_member(guild, int(discord_id))
+                    user = member
+                    log.debug("[NOTIF] Found member: %s (ID: %s)", member, member.id)
+                except discord.NotFound:
+                    log.debug("[NOTIF] User %s not in guild (NotFound)", discord_id)
+                except Exception as e:
+                    log.error("[NOTIF] Error fetching member %s: %s", discord_id, e)
+            elif GUILD_ID:
+                log.warning("[NOTIF] Could not find guild with ID %s", GUILD_ID)
+
+            if user is None:
+                try:
+                    user = await self.fetch_user(int(discord_id))
+                    log.debug("[NOTIF] Found Discord user: %s (ID: %s)", user, user.id)
+                except discord.NotFound:
+                    error_message = f"User not found: {discord_id}"
+                    log.warning("[NOTIF] Could not find user with ID %s", discord_id)
+                except Exception as e:
+                    error_message = str(e)
+                    log.error("[NOTIF] Error fetching user %s: %s", discord_id, e)
+        else:
+            error_message = f"Invalid Discord ID format: {discord_id}"
+            log.warning("[NOTIF] Invalid Discord ID format: %s", discord_id)
+
+        # Assign role
+        if member:
+            role_id = PRODUCT_ROLE_IDS.get(product, SUBSCRIBER_ROLE_ID)
+            log.debug("[NOTIF] Attempting role assignment: GUILD_ID=%s, role_id=%s", GUILD_ID, role_id)
+            if role_id:
+                try:
+                    role = self.get_product_role(product)
+                    log.debug("[NOTIF] Member: %s, Role: %s", member, role)
+                    if role and not _has_role(member, role):
+                        await member.add_roles(role, reason=f"Shopify order #{order_number}")
+                        role_added = True
+                        log.debug("[NOTIF] SUCCESS: Added %s role to %s", product_name, member)
+                    elif role:
+                        log.debug("[NOTIF] User already has the role")
+                        role_added = True  # Already has it
+                except Exception as e:
+                    log.error("[NOTIF] Error adding role to %s: %s", discord_id, e)
+            else:
+                log.warning("[NOTIF] No role_id configured for %s", product)
+        else:
+            log.debug("[NOTIF] No member found, skipping role assignment")
+
+        # Send DM with activation instructions
+        if user:
+            try:
+                # Build a fresh embed from the static template plus this order's fields
+                template = LICENSE_EMBED_TEMPLATES.get(product, LICENSE_EMBED_TEMPLATES["saints-gen"])
+                embed = discord.Embed.from_dict({
+                    **template,
+                    "description": f"Thank you for your purchase! Order #{order_number}",
+                    "fields": [
+                        {"name": "Your Discord ID", "value": f"```{discord_id}```", "inline": False},
+                        # ISO string -> YYYY-MM-DD
+                        {"name": "Expires", "value": expires_at[:10] if expires_at else "Unknown", "inline": True},
+                        *(dict(field) for field in template["fields"]),
+                    ],
+                })
+                if role_added:
+                    embed.set_footer(text=f"Your {product_name} role has been added!")
+
+                async with self._dm_sem:
+                    await user.send(embed=embed)
+                log.info("Sent license DM to %s for order #%s", user, order_number)
+                delivery_success = True
+            except discord.Forbidden:
+                error_message = "DMs disabled"
+                log.warning("Could not DM %s (DMs disabled)", user)
+                # Still mark as success since the license exists and role was added
+                delivery_success = True  # License is in DB, they can use /mykey
+            except Exception as e:
+                error_message = str(e)
+                log.error("Error sending DM to %s: %s", user, e)
+        else:
+            log.warning("Could not deliver license for order #%s - Discord user not found: %s", order_number, discord_id)
+
+        return notification_id, delivery_success, error_message
 
     @process_shopify_notifications.before_loop
     async def before_shopify_notifications(self):
@@ -579,6 +797,37 @@ owner_mention_tracker = {}
 OWNER_MENTION_WINDOW_SECONDS = 1800  # 30 minute window
 OWNER_MENTION_THRESHOLD = 2  # Warn after 2 mentions
 
+# Static auto-reply embeds - built once, never mutated (discord.py serializes on each send)
+REDEEM_HELP_EMBED = discord.Embed.from_dict({
+    "title": "How to Redeem Your Purchase",
+    "description": "Thanks for your purchase! Follow these steps to activate your license:",
+    "color": discord.Color.blue().value,
+    "fields": [
+        {
+            "name": "Step 1",
+            "value": "Make sure you're using the **same email** you purchased with",
+            "inline": False
+        },
+        {
+            "name": "Step 2",
+            "value": "Use the command:\n```/redeem your@email.com```\nReplace `your@email.com` with your purchase email",
+            "inline": False
+        },
+    ],
+    "footer": {"text": "Still having issues? Contact support!"},
+})
+
+OWNER_PATIENCE_EMBED = discord.Embed.from_dict({
+    "title": "⏳ Please Be Patient",
+    "description": (
+        "Hey! The owner is likely **busy or sleeping** right now.\n\n"
+        "They will get to your message as soon as possible. "
+        "Please avoid tagging multiple times - it doesn't speed things up!\n\n"
+        "Thank you for your patience! 🙏"
+    ),
+    "color": discord.Color.orange().value,
+})
+
 
 @bot.event
 async def on_message(message: discord.Message):
@@ -615,17 +864,7 @@ async def on_message(message: discord.Message):
             # Warn if threshold reached and not already warned
             if tracker["count"] >= OWNER_MENTION_THRESHOLD and not tracker["warned"]:
                 tracker["warned"] = True
-                embed = discord.Embed(
-                    title="⏳ Please Be Patient",
-                    description=(
-                        "Hey! The owner is likely **busy or sleeping** right now.\n\n"
-                        "They will get to your message as soon as possible. "
-                        "Please avoid tagging multiple times - it doesn't speed things up!\n\n"
-                        "Thank you for your patience! 🙏"
-                    ),
-                    color=discord.Color.orange()
-                )
-                await message.reply(embed=embed, mention_author=True)
+                await message.reply(embed=OWNER_PATIENCE_EMBED, mention_author=True)
 
     # Check if message contains any help keywords
     content_lower = message.content.lower()
@@ -640,24 +879,7 @@ async def on_message(message: discord.Message):
             # Update cooldown
             auto_help_cooldowns[user_id] = current_time
 
-            embed = discord.Embed(
-                title="How to Redeem Your Purchase",
-                description="Thanks for your purchase! Follow these steps to activate your license:",
-                color=discord.Color.blue()
-            )
-            embed.add_field(
-                name="Step 1",
-                value="Make sure you're using the **same email** you purchased with",
-                inline=False
-            )
-            embed.add_field(
-                name="Step 2",
-                value="Use the command:\n```/redeem your@email.com```\nReplace `your@email.com` with your purchase email",
-                inline=False
-            )
-            embed.set_footer(text="Still having issues? Contact support!")
-
-            await message.reply(embed=embed, mention_author=False)
+            await message.reply(embed=REDEEM_HELP_EMBED, mention_author=False)
 
     # Process commands if any
     await bot.process_commands(message)
@@ -677,22 +899,50 @@ def is_admin_or_helper():
     return app_commands.check(predicate)
 
 
-# ==================== HELPER FUNCTIONS ====================
+# ==================== PRODUCTS ====================
+
+# Products shown per-user in /status and /check
+PRODUCTS = ("saints-gen",)
+
+# Product -> subscriber role ID (saints-gen is the only product now; unknown products fall back to it)
+PRODUCT_ROLE_IDS = {
+    "saints-gen": SUBSCRIBER_ROLE_ID,
+}
+
+# Product -> display name (unknown products display as their key)
+PRODUCT_NAMES = {
+    "saints-gen": "Saint Gen",
+    "saints-gen-gen": "Saint Gen - Gen Mode",
+    "saints-gen-xp": "Saint Gen - XP Mode",
+}
 
-def get_role_id_for_product(product: str) -> int:
-    """Get the role ID for a given product."""
-    # saints-gen is the only product now
-    return SUBSCRIBER_ROLE_ID
+# Product -> setup instructions channel linked after /redeem
+INSTRUCTIONS_LINKS = {
+    "saints-gen": "https://discordapp.com/channels/1290387028185448469/1467010934613737516",
+}
+DEFAULT_INSTRUCTIONS_LINK = "https://discordapp.com/channels/1290387028185448469/1469757937382723727"
 
+# Product -> short tag shown in /licenses
+PRODUCT_TAGS = {
+    "saints-gen": "[Gen]",
+}
 
-def get_product_name(product: str) -> str:
-    """Get display name for a product."""
-    names = {
-        "saints-gen": "Saint Gen",
-        "saints-gen-gen": "Saint Gen - Gen Mode",
-        "saints-gen-xp": "Saint Gen - XP Mode",
+# License DM sent for Shopify orders - static parts built once per product, copied per order
+# (plain dicts: each order gets a fresh Embed, never a mutated shared one)
+LICENSE_EMBED_TEMPLATES = {
+    product: {
+        "title": f"Your {name} License",
+        "color": discord.Color.green().value,
+        "fields": (
+            {
+                "name": "How to Activate",
+                "value": f"1. Open {name}\n2. Enter your Discord ID when prompted\n3. Click Activate",
+                "inline": False,
+            },
+        ),
     }
-    return names.get(product, product)
+    for product, name in PRODUCT_NAMES.items()
+}
 
 
 # Audit log channel
@@ -782,7 +1032,7 @@ def build_status_embed() -> discord.Embed:
     color_map = {"detected": 0xFF3366, "risky": 0xFFAA00, "maintenance": 0x5865F2, "undetected": 0x00FF88}
     embed = discord.Embed(
         color=color_map.get(worst, 0x00FF88),
-        timestamp=datetime.utcnow()
+        timestamp=discord.utils.utcnow()
     )
 
     embed.title = "SAINT STATUS"
@@ -885,7 +1135,7 @@ async def send_audit_log(title: str, description: str, admin: discord.User, colo
                 title=title,
                 description=description,
                 color=color,
-                timestamp=datetime.utcnow()
+                timestamp=discord.utils.utcnow()
             )
             embed.set_author(name=f"{admin.display_name}", icon_url=admin.display_avatar.url)
             if fields:
@@ -924,55 +1174,36 @@ async def generate(interaction: discord.Interaction, user: discord.User, days: i
         return
 
     # Product display name
-    product_name = get_product_name(product)
+    product_name = PRODUCT_NAMES.get(product, product)
     discord_id = str(user.id)
 
-    # Check if user already has an active license for this product
-    existing_license = await get_license_by_user(discord_id, product)
-    extended = False
-
-    if existing_license and not existing_license.get("revoked"):
-        # User has existing license - extend it
-        new_expiry = await extend_user_license_for_product(discord_id, days, product)
-        if new_expiry:
-            expires_at = datetime.fromisoformat(new_expiry)
-            extended = True
-        else:
-            await interaction.response.send_message(
-                f"Failed to extend {user.mention}'s existing subscription. Try again.", ephemeral=True)
-            return
-    else:
-        # No existing license - create new one
-        from datetime import timedelta
-        expires_at = datetime.utcnow() + timedelta(days=days)
-
-        # Generate internal key (user never sees this)
-        license_key, _ = generate_license_key(SECRET_KEY, discord_id, days, user.name, "")
-
-        # Store in database
-        success = await add_license(
-            license_key=license_key,
-            discord_id=discord_id,
-            discord_name=str(user),
-            expires_at=expires_at,
-            product=product
-        )
-
-        if not success:
-            await interaction.response.send_message(
-                "Failed to create subscription. Try again.", ephemeral=True)
-            return
+    # Extend the user's active license for this product, or create one, in a single query.
+    # The internal key (user never sees it) is only stored if a new license is created.
+    license_key, _ = generate_license_key(SECRET_KEY, discord_id, days, user.name, "")
+    result = await upsert_license_extending(
+        license_key=license_key,
+        discord_id=discord_id,
+        discord_name=str(user),
+        days=days,
+        product=product
+    )
+    if not result:
+        await interaction.response.send_message(
+            "Failed to create subscription. Try again.", ephemeral=True)
+        return
+    expires_at, created = result
+    extended = not created
 
     # Give appropriate role based on product
     role_added = False
-    role_id = get_role_id_for_product(product)
-    if GUILD_ID and role_id:
+    if GUILD_ID:
         try:
-            guild = bot.get_guild(GUILD_ID)
-            if guild:
-                member = await guild.fetch_member(user.id)
-                role = guild.get_role(role_id)
-                if member and role and role not in member.roles:
+            guild = bot._guild or bot.get_guild(GUILD_ID)
+            role = bot.get_product_role(product)
+            if guild and role:
+                # Slash-command options resolve to a Member of the invoking guild, which may not be ours
+                member = await _guild_member(guild, user)
+                if member and not _has_role(member, role):
                     await member.add_roles(role, reason=f"Subscription added for {product}")
                     role_added = True
         except Exception as e:
@@ -995,38 +1226,40 @@ async def generate(interaction: discord.Interaction, user: discord.User, days: i
 
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    # Audit log
-    await send_audit_log(
-        title="License Extended" if extended else "License Generated",
-        description=f"{'Extended' if extended else 'Generated'} **{product_name}** license for {user.mention}",
-        admin=interaction.user,
-        color=discord.Color.green(),
-        fields=[
-            {"name": "User", "value": f"{user} (`{user.id}`)", "inline": True},
-            {"name": "Product", "value": product_name, "inline": True},
-            {"name": "Days Added", "value": f"+{days}", "inline": True},
-            {"name": "Expires", "value": expires_at.strftime("%Y-%m-%d"), "inline": True},
-        ]
+    # DM the user (no key, just tell them to use Discord ID)
+    user_embed = discord.Embed(
+        title=f"{product_name} {'Extended' if extended else 'Access Granted'}!",
+        description=f"{'Your subscription has been extended!' if extended else 'You now have access to the product.'}",
+        color=discord.Color.green()
+    )
+    user_embed.add_field(name="Days Added", value=f"+{days} days", inline=True)
+    user_embed.add_field(name="Expires", value=expires_at.strftime("%Y-%m-%d %H:%M UTC"), inline=True)
+    user_embed.add_field(name="Your Discord ID", value=f"```{user.id}```", inline=False)
+    user_embed.add_field(
+        name="How to Activate",
+        value=f"1. Open {product_name}\n2. Enter your Discord ID\n3. Click Activate",
+        inline=False
     )
 
-    # DM the user (no key, just tell them to use Discord ID)
-    try:
-        user_embed = discord.Embed(
-            title=f"{product_name} {'Extended' if extended else 'Access Granted'}!",
-            description=f"{'Your subscription has been extended!' if extended else 'You now have access to the product.'}",
-            color=discord.Color.green()
-        )
-        user_embed.add_field(name="Days Added", value=f"+{days} days", inline=True)
-        user_embed.add_field(name="Expires", value=expires_at.strftime("%Y-%m-%d %H:%M UTC"), inline=True)
-        user_embed.add_field(name="Your Discord ID", value=f"```{user.id}```", inline=False)
-        user_embed.add_field(
-            name="How to Activate",
-            value=f"1. Open {product_name}\n2. Enter your Discord ID\n3. Click Activate",
-            inline=False
-        )
-        await user.send(embed=user_embed)
-    except discord.Forbidden:
-        pass  # User has DMs disabled
+    # Audit log and DM are independent - send them together
+    _, dm_result = await asyncio.gather(
+        send_audit_log(
+            title="License Extended" if extended else "License Generated",
+            description=f"{'Extended' if extended else 'Generated'} **{product_name}** license for {user.mention}",
+            admin=interaction.user,
+            color=discord.Color.green(),
+            fields=[
+                {"name": "User", "value": f"{user} (`{user.id}`)", "inline": True},
+                {"name": "Product", "value": product_name, "inline": True},
+                {"name": "Days Added", "value": f"+{days}", "inline": True},
+                {"name": "Expires", "value": expires_at.strftime("%Y-%m-%d"), "inline": True},
+            ]
+        ),
+        user.send(embed=user_embed),
+        return_exceptions=True
+    )
+    if isinstance(dm_result, Exception) and not isinstance(dm_result, discord.Forbidden):
+        raise dm_result  # Forbidden just means the user has DMs disabled
 
 
 @bot.tree.command(name="revoke", description="Revoke a user's license")
@@ -1080,7 +1313,7 @@ async def extend(
     days_display = f"+{days}" if days > 0 else str(days)
 
     new_expiry = await extend_user_license_for_product(str(user.id), days, product)
-    product_name = get_product_name(product)
+    product_name = PRODUCT_NAMES.get(product, product)
     if new_expiry:
         expiry_dt = datetime.fromisoformat(new_expiry)
         await interaction.response.send_message(
@@ -1108,7 +1341,11 @@ async def extend(
 @app_commands.choices(product=PRODUCT_CHOICES)
 async def list_licenses(interaction: discord.Interaction, product: str = None):
     """List all active licenses."""
-    licenses = await get_all_active_licenses(product)
+    # Independent queries - run them together
+    licenses, stats = await asyncio.gather(
+        get_all_active_licenses(product),
+        get_license_stats(product)
+    )
 
     if not licenses:
         await interaction.response.send_message("No active licenses.", ephemeral=True)
@@ -1116,7 +1353,7 @@ async def list_licenses(interaction: discord.Interaction, product: str = None):
 
     title = "Active Licenses"
     if product:
-        product_name = get_product_name(product)
+        product_name = PRODUCT_NAMES.get(product, product)
         title = f"Active {product_name} Licenses"
 
     embed = discord.Embed(
@@ -1125,18 +1362,15 @@ async def list_licenses(interaction: discord.Interaction, product: str = None):
     )
 
     # Show up to 10 licenses in the embed
+    now = utcnow()
     for lic in licenses[:10]:
         expires = lic["expires_at"]
-        if isinstance(expires, str):
-            expires = datetime.fromisoformat(expires)
-        days_left = (expires - datetime.utcnow()).days
+        days_left = (expires - now).days
         hwid_status = "🔒" if lic.get("hwid") else "🔓"
-        # Product tag
-        prod = lic.get("product", "saints-gen")
-        prod_tag = "[Gen]"
+        prod_tag = PRODUCT_TAGS.get(lic.get("product", "saints-gen"), "[Gen]")
         embed.add_field(
             name=f"{hwid_status} {prod_tag} {lic['discord_name']}",
-            value=f"Expires: {expires.strftime('%Y-%m-%d')} ({days_left}d left)",
+            value=f"Expires: {expires:%Y-%m-%d} ({days_left}d left)",
             inline=True
         )
 
@@ -1146,7 +1380,6 @@ async def list_licenses(interaction: discord.Interaction, product: str = None):
         embed.set_footer(text="🔒 = hardware bound | 🔓 = not yet activated")
 
     # Add stats
-    stats = await get_license_stats(product)
     embed.description = f"**Stats:** {stats['active']} active, {stats['expired']} expired, {stats['revoked']} revoked"
 
     await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -1165,7 +1398,7 @@ async def stats(interaction: discord.Interaction):
     embed = discord.Embed(
         title="📊 License Statistics",
         color=discord.Color.gold(),
-        timestamp=datetime.utcnow()
+        timestamp=discord.utils.utcnow()
     )
 
     # Overall stats
@@ -1190,7 +1423,6 @@ async def stats(interaction: discord.Interaction):
 
     # Get referral stats from database
     try:
-        from database import get_pool
         pool = await get_pool()
         async with pool.acquire() as conn:
             total_referrals = await conn.fetchval("SELECT COUNT(*) FROM referrals")
@@ -1236,7 +1468,7 @@ async def stats(interaction: discord.Interaction):
 async def check(interaction: discord.Interaction, user: discord.User):
     """Check a user's subscription status (admin only)."""
     discord_id = str(user.id)
-    now = datetime.utcnow()
+    now = utcnow()
 
     # Get all licenses for user
     all_licenses = await get_all_licenses_for_user(discord_id)
@@ -1247,7 +1479,8 @@ async def check(interaction: discord.Interaction, user: discord.User):
         color=discord.Color.blue()
     )
     embed.set_author(name=f"{user.display_name} ({user.id})", icon_url=user.display_avatar.url)
-    embed.set_thumbnail(url=user.display_avatar.url)
+    if user.avatar is not None:  # default avatars add nothing to the embed
+        embed.set_thumbnail(url=user.display_avatar.url)
 
     if not all_licenses:
         embed.description = f"{user.mention} has no licenses (past or present)."
@@ -1255,16 +1488,13 @@ async def check(interaction: discord.Interaction, user: discord.User):
         return
 
     # Group licenses by product
-    products = ["saints-gen"]
+    best_active, seen = _best_licenses_by_product(all_licenses)
+    t30, t7 = _expiry_thresholds(now)
 
-    for prod in products:
-        prod_name = get_product_name(prod)
-        prod_licenses = [
-            lic for lic in all_licenses
-            if lic.get("product") == prod
-        ]
+    for prod in PRODUCTS:
+        prod_name = PRODUCT_NAMES.get(prod, prod)
 
-        if not prod_licenses:
+        if prod not in seen:
             embed.add_field(
                 name=f"⚫ {prod_name}",
                 value="No license history",
@@ -1272,39 +1502,33 @@ async def check(interaction: discord.Interaction, user: discord.User):
             )
             continue
 
-        # Find the best active license
-        active_licenses = [
-            lic for lic in prod_licenses
-            if not lic.get("revoked")
-        ]
+        # Best active license (None if all revoked)
+        best = best_active.get(prod)
 
-        if active_licenses:
-            best = max(active_licenses, key=lambda x: x["expires_at"] if isinstance(x["expires_at"], datetime) else datetime.fromisoformat(str(x["expires_at"])))
+        if best:
             expires = best["expires_at"]
-            if isinstance(expires, str):
-                expires = datetime.fromisoformat(expires)
 
             hwid = best.get("hwid")
             hwid_status = f"`{hwid[:12]}...`" if hwid else "Not bound"
 
             if expires > now:
                 days_left = (expires - now).days
-                if days_left > 30:
+                if expires >= t30:
                     status_emoji = "🟢"
-                elif days_left > 7:
+                elif expires >= t7:
                     status_emoji = "🟡"
                 else:
                     status_emoji = "🟠"
 
                 embed.add_field(
                     name=f"{status_emoji} {prod_name}",
-                    value=f"**Status:** Active\n**Days Left:** {days_left}\n**Expires:** {expires.strftime('%b %d, %Y')}\n**HWID:** {hwid_status}",
+                    value=f"**Status:** Active\n**Days Left:** {days_left}\n**Expires:** {format_short_date(expires)}\n**HWID:** {hwid_status}",
                     inline=False
                 )
             else:
                 embed.add_field(
                     name=f"🔴 {prod_name}",
-                    value=f"**Status:** Expired\n**Expired:** {expires.strftime('%b %d, %Y')}\n**HWID:** {hwid_status}",
+                    value=f"**Status:** Expired\n**Expired:** {format_short_date(expires)}\n**HWID:** {hwid_status}",
                     inline=False
                 )
         else:
@@ -1350,8 +1574,14 @@ async def reset_hwid(interaction: discord.Interaction, user: discord.User):
 @is_admin()
 async def pending_orders(interaction: discord.Interaction):
     """View pending and failed Shopify order notifications."""
-    pending = await get_pending_notifications()
-    failed = await get_failed_notifications()
+    # Only the first 5 of each are shown, so fetch those plus the totals
+    pending, failed, counts = await asyncio.gather(
+        get_pending_notifications(limit=5),
+        get_failed_notifications(limit=5),
+        count_notifications()
+    )
+    pending_total = counts["pending"]
+    failed_total = counts["failed"]
 
     embed = discord.Embed(
         title="Shopify Order Notifications",
@@ -1359,27 +1589,30 @@ async def pending_orders(interaction: discord.Interaction):
     )
 
     if pending:
-        pending_text = ""
-        for notif in pending[:5]:
-            pending_text += f"Order #{notif.get('order_number', 'N/A')} - <@{notif['discord_id']}> (Attempts: {notif.get('delivery_attempts', 0)})\n"
-        if len(pending) > 5:
-            pending_text += f"... and {len(pending) - 5} more"
-        embed.add_field(name=f"Pending ({len(pending)})", value=pending_text or "None", inline=False)
+        lines = [
+            f"Order #{notif.get('order_number', 'N/A')} - <@{notif['discord_id']}> (Attempts: {notif.get('delivery_attempts', 0)})"
+            for notif in pending
+        ]
+        if pending_total > len(pending):
+            lines.append(f"... and {pending_total - len(pending)} more")
+        pending_text = "\n".join(lines)
+        embed.add_field(name=f"Pending ({pending_total})", value=pending_text or "None", inline=False)
     else:
         embed.add_field(name="Pending", value="No pending notifications", inline=False)
 
     if failed:
-        failed_text = ""
-        for notif in failed[:5]:
-            error = notif.get('error_message', 'Unknown')[:50]
-            failed_text += f"Order #{notif.get('order_number', 'N/A')} - {notif['discord_id']}\nError: {error}\n\n"
-        if len(failed) > 5:
-            failed_text += f"... and {len(failed) - 5} more"
-        embed.add_field(name=f"Failed ({len(failed)})", value=failed_text or "None", inline=False)
+        entries = [
+            f"Order #{notif.get('order_number', 'N/A')} - {notif['discord_id']}\nError: {notif.get('error_message', 'Unknown')[:50]}"
+            for notif in failed
+        ]
+        if failed_total > len(failed):
+            entries.append(f"... and {failed_total - len(failed)} more")
+        failed_text = "\n\n".join(entries)
+        embed.add_field(name=f"Failed ({failed_total})", value=failed_text or "None", inline=False)
     else:
         embed.add_field(name="Failed", value="No failed notifications", inline=False)
 
-    embed.set_footer(text="Pending notifications retry automatically every 10 seconds")
+    embed.set_footer(text=f"Pending notifications retry automatically every {NOTIFICATION_POLL_SECONDS} seconds")
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
@@ -1400,36 +1633,39 @@ async def get_id(interaction: discord.Interaction):
         value=f"```{user.id}```",
         inline=False
     )
-    embed.set_thumbnail(url=user.display_avatar.url)
+    if user.avatar is not None:  # default avatars add nothing to the embed
+        embed.set_thumbnail(url=user.display_avatar.url)
 
     await interaction.response.send_message(embed=embed)
 
 
+# /status field for each product the user has no active subscription to, built once
+NOT_SUBSCRIBED_FIELDS = {
+    prod: {"name": f"⚫ {PRODUCT_NAMES.get(prod, prod)}", "value": "Not subscribed", "inline": True}
+    for prod in PRODUCTS
+}
+
+
 @bot.tree.command(name="status", description="Check your subscription status")
+@app_commands.checks.cooldown(1, 2.0, key=lambda i: i.user.id)
 async def status(interaction: discord.Interaction):
     """Check subscription status for all products."""
     user = interaction.user
     discord_id = str(user.id)
-    now = datetime.utcnow()
+    now = utcnow()
 
     # Get all licenses for user
     all_licenses = await get_all_licenses_for_user(discord_id)
 
     # Filter to get best license per product (active, not revoked, latest expiry)
-    products = ["saints-gen"]
     active_subs = {}
+    best_active, _ = _best_licenses_by_product(all_licenses)
+    t30, t7 = _expiry_thresholds(now)
 
-    for prod in products:
-        prod_licenses = [
-            lic for lic in all_licenses
-            if lic.get("product") == prod and not lic.get("revoked")
-        ]
-        if prod_licenses:
-            # Get the one with latest expiry
-            best = max(prod_licenses, key=lambda x: x["expires_at"] if isinstance(x["expires_at"], datetime) else datetime.fromisoformat(str(x["expires_at"])))
+    for prod in PRODUCTS:
+        best = best_active.get(prod)
+        if best:
             expires = best["expires_at"]
-            if isinstance(expires, str):
-                expires = datetime.fromisoformat(expires)
 
             # Check if this is a pending activation license
             pending_days = best.get("pending_days")
@@ -1446,11 +1682,12 @@ async def status(interaction: discord.Interaction):
             color=discord.Color.gold()
         )
         embed.set_author(name=user.display_name, icon_url=user.display_avatar.url)
-        embed.set_thumbnail(url=user.display_avatar.url)
+        if user.avatar is not None:  # default avatars add nothing to the embed
+            embed.set_thumbnail(url=user.display_avatar.url)
 
         # Add each active subscription
-        for prod in products:
-            prod_name = get_product_name(prod)
+        for prod in PRODUCTS:
+            prod_name = PRODUCT_NAMES.get(prod, prod)
 
             if prod in active_subs:
                 sub = active_subs[prod]
@@ -1467,24 +1704,20 @@ async def status(interaction: discord.Interaction):
                     expires = sub["expires"]
 
                     # Status emoji and color indicator
-                    if days > 30:
+                    if expires >= t30:
                         status_emoji = "🟢"
-                    elif days > 7:
+                    elif expires >= t7:
                         status_emoji = "🟡"
                     else:
                         status_emoji = "🟠"
 
                     embed.add_field(
                         name=f"{status_emoji} {prod_name}",
-                        value=f"**{days}** days remaining\nExpires: {expires.strftime('%b %d, %Y')}",
+                        value=f"**{days}** days remaining\nExpires: {format_short_date(expires)}",
                         inline=True
                     )
             else:
-                embed.add_field(
-                    name=f"⚫ {prod_name}",
-                    value="Not subscribed",
-                    inline=True
-                )
+                embed.add_field(**NOT_SUBSCRIBED_FIELDS[prod])
 
     else:
         # No active subscriptions
@@ -1494,16 +1727,12 @@ async def status(interaction: discord.Interaction):
             color=discord.Color.dark_gray()
         )
         embed.set_author(name=user.display_name, icon_url=user.display_avatar.url)
-        embed.set_thumbnail(url=user.display_avatar.url)
+        if user.avatar is not None:  # default avatars add nothing to the embed
+            embed.set_thumbnail(url=user.display_avatar.url)
 
         # Show all products as not subscribed
-        for prod in products:
-            prod_name = get_product_name(prod)
-            embed.add_field(
-                name=f"⚫ {prod_name}",
-                value="Not subscribed",
-                inline=True
-            )
+        for prod in PRODUCTS:
+            embed.add_field(**NOT_SUBSCRIBED_FIELDS[prod])
 
         embed.add_field(
             name="Get Access",
@@ -1516,14 +1745,74 @@ async def status(interaction: discord.Interaction):
 
 # ==================== REDEMPTION SYSTEM ====================
 
+# Users whose DMs were rejected (Forbidden) since startup
+_NO_DM = set()
+
+
+async def _assign_redeem_role(user, product: str, email: str) -> Optional[discord.Role]:
+    """Give the product role to a redeeming user. Returns the role if it was assigned."""
+    if not GUILD_ID:
+        return None
+    try:
+        guild = bot._guild or bot.get_guild(GUILD_ID)
+        role = bot.get_product_role(product)
+        if guild and role:
+            member = await _guild_member(guild, user)
+            if member:
+                if not _has_role(member, role):  # repeat redemptions already hold it
+                    await member.add_roles(role, reason=f"Redeemed purchase: {email}")
+                return role
+    except Exception as e:
+        log.error("Error assigning role: %s", e)
+    return None
+
+
+async def _safe_dm(user, embed: discord.Embed):
+    """DM a user, remembering users who have DMs disabled so they aren't retried."""
+    if user.id in _NO_DM:
+        return
+    try:
+        await user.send(embed=embed)
+    except discord.Forbidden:
+        _NO_DM.add(user.id)  # DMs disabled - don't retry until restart
+    except Exception as e:
+        log.warning("Failed to DM %s: %s", user.id, e)
+
+
+async def _send_redeem_log(uid: str, umention: str, product_name: str, days: int, expires_at: datetime,
+                           email: str, order_number: str, extended: bool):
+    """Post a redemption to the redemption log channel."""
+    try:
+        log_channel = bot.get_channel(1290509478445322292)
+        if log_channel:
+            log_embed = discord.Embed(
+                title="License Extended" if extended else "New License",
+                color=discord.Color.blue()
+            )
+            log_embed.add_field(name="User", value=f"{umention} (`{uid}`)", inline=False)
+            log_embed.add_field(name="Product", value=product_name, inline=True)
+            log_embed.add_field(name="Days", value=f"+{days}", inline=True)
+            log_embed.add_field(name="Expires", value=format_long_date(expires_at), inline=True)
+            log_embed.add_field(name="Email", value=f"||{email}||", inline=False)
+            log_embed.set_footer(text=f"Order: {order_number}")
+            log_embed.timestamp = discord.utils.utcnow()
+            await log_channel.send(embed=log_embed)
+    except Exception as e:
+        log.error("Failed to log redemption: %s", e)
+
+
 @bot.tree.command(name="redeem", description="Redeem your purchase using your email")
 @app_commands.describe(email="The email you used for your Shopify purchase")
 async def redeem(interaction: discord.Interaction, email: str):
     """Redeem a purchase using your email to get your license and role."""
     await interaction.response.defer(ephemeral=True)
+    user = interaction.user
+    uid = str(user.id)
+    uname = user.display_name
+    umention = user.mention
 
     # Try to redeem by email
-    purchase = await redeem_by_email(email.strip(), str(interaction.user.id))
+    purchase = await redeem_by_email(email, uid)
 
     if not purchase:
         embed = discord.Embed(
@@ -1539,83 +1828,47 @@ async def redeem(interaction: discord.Interaction, email: str):
     # Purchase found - check if user already has a license for this product
     product = purchase["product"]
     days = purchase["days"]
-    customer_name = purchase.get("customer_name") or interaction.user.display_name
-
-    from datetime import timedelta
-
-    # Check for existing license
-    existing_license = await get_license_by_user(str(interaction.user.id), product)
-
-    if existing_license and not existing_license.get("revoked"):
-        # User already has a license - extend it
-        new_expiry = await extend_user_license_for_product(str(interaction.user.id), days, product)
-        if new_expiry:
-            expires_at = datetime.fromisoformat(new_expiry)
-            extended = True
-            pending_activation = False
-        else:
-            embed = discord.Embed(
-                title="Error",
-                description="Failed to extend license. Please contact support.",
-                color=discord.Color.red()
-            )
-            await interaction.followup.send(embed=embed)
-            return
-    else:
-        # No existing license - create new one with pending activation
-        # Countdown doesn't start until they use the program
-        extended = False
-        pending_activation = True
-        # Set a placeholder far-future date - real expiry set on first program activation
-        expires_at = datetime(2099, 12, 31, 23, 59, 59)
-
-        license_key, _ = generate_license_key(
-            SECRET_KEY,
-            str(interaction.user.id),
-            days,
-            customer_name
-        )
+    customer_name = purchase.get("customer_name") or uname
+
+    # Extend an existing license, or create one pending activation, in a single query.
+    # New licenses get a far-future placeholder expiry; the countdown starts on first program activation.
+    license_key, _ = generate_license_key(
+        SECRET_KEY,
+        uid,
+        days,
+        customer_name
+    )
+    result = await upsert_license_extending(
+        license_key=license_key,
+        discord_id=uid,
+        discord_name=uname,
+        days=days,
+        product=product,
+        created_expires_at=datetime(2099, 12, 31, 23, 59, 59),
+        pending_days=days
+    )
 
-        # Save license to database with pending_days
-        success = await add_license(
-            license_key=license_key,
-            discord_id=str(interaction.user.id),
-            discord_name=interaction.user.display_name,
-            expires_at=expires_at,
-            product=product,
-            pending_days=days
+    if not result:
+        embed = discord.Embed(
+            title="Error",
+            description="Failed to create license. Please contact support.",
+            color=discord.Color.red()
         )
+        await interaction.followup.send(embed=embed)
+        return
 
-        if not success:
-            embed = discord.Embed(
-                title="Error",
-                description="Failed to create license. Please contact support.",
-                color=discord.Color.red()
-            )
-            await interaction.followup.send(embed=embed)
-            return
-
-    # Assign role
-    role_assigned = False
-    role_name = ""
-    if GUILD_ID:
-        try:
-            guild = bot.get_guild(GUILD_ID)
-            if guild:
-                member = guild.get_member(interaction.user.id)
-                if member:
-                    role_id = get_role_id_for_product(product)
-                    if role_id:
-                        role = guild.get_role(role_id)
-                        if role:
-                            await member.add_roles(role, reason=f"Redeemed purchase: {email}")
-                            role_assigned = True
-                            role_name = role.name
-        except Exception as e:
-            print(f"Error assigning role: {e}")
+    expires_at, created = result
+    extended = not created
 
     # Product name for display
-    product_name = get_product_name(product)
+    product_name = PRODUCT_NAMES.get(product, product)
+
+    # Role assignment and the log post don't depend on each other - run them together
+    role, _ = await asyncio.gather(
+        _assign_redeem_role(user, product, email),
+        _send_redeem_log(uid, umention, product_name, days, expires_at, email,
+                         purchase.get("order_number", "N/A"), extended)
+    )
 
     # Send success embed
     if extended:
@@ -1626,7 +1879,7 @@ async def redeem(interaction: discord.Interaction, email: str):
         )
         embed.add_field(name="Product", value=product_name, inline=True)
         embed.add_field(name="Days Added", value=f"+{days} days", inline=True)
-        embed.add_field(name="Expires", value=expires_at.strftime("%B %d, %Y"), inline=True)
+        embed.add_field(name="Expires", value=format_long_date(expires_at), inline=True)
     else:
         embed = discord.Embed(
             title="Purchase Redeemed!",
@@ -1637,14 +1890,11 @@ async def redeem(interaction: discord.Interaction, email: str):
         embed.add_field(name="Duration", value=f"{days} days", inline=True)
         embed.add_field(name="Activation", value="Countdown starts when you open the program", inline=False)
 
-    if role_assigned:
-        embed.add_field(name="Role", value=f"✅ {role_name} assigned", inline=False)
+    if role:
+        embed.add_field(name="Role", value=f"✅ {role.name} assigned", inline=False)
 
     # Product-specific instructions link
-    if product == "saints-gen":
-        instructions_link = "https://discordapp.com/channels/1290387028185448469/1467010934613737516"
-    else:
-        instructions_link = "https://discordapp.com/channels/1290387028185448469/1469757937382723727"
+    instructions_link = INSTRUCTIONS_LINKS.get(product, DEFAULT_INSTRUCTIONS_LINK)
 
     embed.add_field(
         name="Next Steps",
@@ -1654,55 +1904,10 @@ async def redeem(interaction: discord.Interaction, email: str):
 
     await interaction.followup.send(embed=embed)
 
-    # Also DM the user their license info
-    try:
-        if extended:
-            dm_embed = discord.Embed(
-                title=f"{product_name} License Extended!",
-                description=f"**+{days} days** added to your license!",
-                color=discord.Color.green()
-            )
-            dm_embed.add_field(name="Product", value=product_name, inline=True)
-            dm_embed.add_field(name="Days Added", value=f"+{days} days", inline=True)
-            dm_embed.add_field(name="Expires", value=expires_at.strftime("%B %d, %Y"), inline=True)
-        else:
-            dm_embed = discord.Embed(
-                title=f"{product_name} License Ready!",
-                description="Thank you for your purchase!",
-                color=discord.Color.green()
-            )
-            dm_embed.add_field(name="Product", value=product_name, inline=True)
-            dm_embed.add_field(name="Duration", value=f"{days} days", inline=True)
-            dm_embed.add_field(name="Activation", value="Your countdown starts when you first open the program", inline=False)
-        dm_embed.add_field(
-            name="Next Steps",
-            value=f"Go to {instructions_link} for further instructions",
-            inline=False
-        )
-        await interaction.user.send(embed=dm_embed)
-    except:
-        pass  # DMs might be disabled
+    # Also DM the user their license info (same embed; it's serialized per send)
+    bot.queue_dm(user, embed)
 
-    print(f"Purchase redeemed by {interaction.user} ({interaction.user.id}) - {email} - {product_name} {days} days")
-
-    # Log to redemption log channel
-    try:
-        log_channel = bot.get_channel(1290509478445322292)
-        if log_channel:
-            log_embed = discord.Embed(
-                title="License Extended" if extended else "New License",
-                color=discord.Color.blue()
-            )
-            log_embed.add_field(name="User", value=f"{interaction.user.mention} (`{interaction.user.id}`)", inline=False)
-            log_embed.add_field(name="Product", value=product_name, inline=True)
-            log_embed.add_field(name="Days", value=f"+{days}", inline=True)
-            log_embed.add_field(name="Expires", value=expires_at.strftime("%B %d, %Y"), inline=True)
-            log_embed.add_field(name="Email", value=f"||{email}||", inline=False)
-            log_embed.set_footer(text=f"Order: {purchase.get('order_number', 'N/A')}")
-            log_embed.timestamp = datetime.utcnow()
-            await log_channel.send(embed=log_embed)
-    except Exception as e:
-        print(f"Failed to log redemption: {e}")
+    log.info("Purchase redeemed by %s (%s) - %s - %s %d days", user, uid, email, product_name, days)
 
 
 # ==================== STATUS COMMAND ====================
@@ -1732,7 +1937,7 @@ async def setstatus(interaction: discord.Interaction, product: str, status: str)
     old_status = PRODUCT_STATUS.get(product, "undetected")
     PRODUCT_STATUS[product] = status
 
-    product_name = get_product_name(product)
+    product_name = PRODUCT_NAMES.get(product, product)
     old_info = STATUS_DISPLAY.get(old_status, STATUS_DISPLAY["undetected"])
     new_info = STATUS_DISPLAY.get(status, STATUS_DISPLAY["undetected"])
 
@@ -1834,7 +2039,10 @@ async def setup_hwid_reset(interaction: discord.Interaction):
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
-    if isinstance(error, app_commands.CheckFailure):
+    if isinstance(error, app_commands.CommandOnCooldown):
+        await interaction.response.send_message(
+            f"Please wait {error.retry_after:.1f}s before using this command again.", ephemeral=True)
+    elif isinstance(error, app_commands.CheckFailure):
         await interaction.response.send_message(
             "You don't have permission to use this command."        )
     else:
@@ -1847,18 +2055,10 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
 
 def run_api():
     """Run the FastAPI server in a separate thread."""
-    import uvicorn
-    from api import app
-    import os
-
-    port = int(os.getenv("PORT", 8080))
-    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
+    uvicorn.run(app, host="0.0.0.0", port=API_PORT, log_level="info")
 
 
 def main():
-    import threading
-    import os
-
     if not DISCORD_TOKEN:
         print("ERROR: DISCORD_TOKEN not set!")
         print("Please set the DISCORD_TOKEN environment variable or create a .env file.")
@@ -1873,10 +2073,10 @@ def main():
     # Start API server in background thread
     api_thread = threading.Thread(target=run_api, daemon=True)
     api_thread.start()
-    print(f"API server started on port {os.getenv('PORT', 8080)}")
+    print(f"API server started on port {API_PORT}")
 
     # Run Discord bot (blocking)
-    bot.run(DISCORD_TOKEN)
+    bot.run(DISCORD_TOKEN, root_logger=True)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 """Async PostgreSQL database operations for license management."""
 import asyncpg
 import ssl
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict
 import os
 import sys
@@ -12,6 +12,25 @@ DATABASE_URL = os.getenv("DATABASE_URL", "")
 # Connection pool
 _pool: Optional[asyncpg.Pool] = None
 
+# Pool sizing for the bot: slash commands, background loops and gathered queries share it
+POOL_OPTIONS = {
+    "min_size": 5,
+    "max_size": 20,
+    "max_inactive_connection_lifetime": 300,
+    "max_queries": 50000,
+    "command_timeout": 30,
+}
+
+
+def utcnow() -> datetime:
+    """Current UTC time as a naive datetime (license columns are TIMESTAMP without time zone)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def normalize_email(email: str) -> str:
+    """Canonical form emails are stored and matched in (trimmed, lowercased)."""
+    return email.strip().lower()
+
 
 def _parse_database_url(url: str) -> tuple:
     """Parse DATABASE_URL and extract SSL mode if present."""
@@ -41,12 +60,19 @@ async def get_pool() -> asyncpg.Pool:
             ssl_ctx = ssl.create_default_context()
             ssl_ctx.check_hostname = False
             ssl_ctx.verify_mode = ssl.CERT_NONE
-            _pool = await asyncpg.create_pool(clean_url, min_size=1, max_size=10, ssl=ssl_ctx)
+            _pool = await asyncpg.create_pool(clean_url, ssl=ssl_ctx, **POOL_OPTIONS)
         else:
-            _pool = await asyncpg.create_pool(clean_url, min_size=1, max_size=10)
+            _pool = await asyncpg.create_pool(clean_url, **POOL_OPTIONS)
     return _pool
 
 
+def get_pool_stats() -> Dict:
+    """Current pool size and idle connection count (zeros before the pool exists)."""
+    if _pool is None:
+        return {"size": 0, "idle": 0}
+    return {"size": _pool.get_size(), "idle": _pool.get_idle_size()}
+
+
 async def close_pool():
     """Close the connection pool."""
     global _pool
@@ -135,7 +161,7 @@ async def add_pending_order(
             """INSERT INTO pending_orders (email, order_number, customer_name, product, days)
                VALUES ($1, $2, $3, $4, $5)
                RETURNING id""",
-            email.lower().strip(), order_number, customer_name, product, days
+            normalize_email(email), order_number, customer_name, product, days
         )
         return row["id"]
 
@@ -149,7 +175,7 @@ async def get_pending_order_by_email(email: str) -> Optional[Dict]:
                WHERE email = $1 AND claimed = 0
                ORDER BY created_at DESC
                LIMIT 1""",
-            email.lower().strip()
+            normalize_email(email)
         )
         if row:
             return dict(row)
@@ -164,7 +190,7 @@ async def claim_pending_order(order_id: int, discord_id: str) -> bool:
             """UPDATE pending_orders
                SET claimed = 1, claimed_by = $1, claimed_at = $2
                WHERE id = $3 AND claimed = 0""",
-            discord_id, datetime.utcnow(), order_id
+            discord_id, utcnow(), order_id
         )
         return "UPDATE 1" in result
 
@@ -195,7 +221,7 @@ async def save_linked_account(email: str, discord_id: str, discord_name: str = N
                 discord_id = $2,
                 discord_name = $3,
                 linked_at = $4
-        """, email.lower().strip(), discord_id, discord_name, datetime.utcnow())
+        """, normalize_email(email), discord_id, discord_name, utcnow())
         return True
 
 
@@ -205,7 +231,7 @@ async def get_linked_discord_id(email: str) -> Optional[Dict]:
     async with pool.acquire() as conn:
         row = await conn.fetchrow(
             "SELECT * FROM linked_accounts WHERE email = $1",
-            email.lower().strip()
+            normalize_email(email)
         )
         if row:
             return dict(row)
@@ -270,15 +296,23 @@ async def get_license_by_user(discord_id: str, product: str = None) -> Optional[
     return None
 
 
+def _license_dict(row) -> Dict:
+    """Convert a license row to a dict with expires_at guaranteed to be a datetime."""
+    lic = dict(row)
+    if isinstance(lic.get("expires_at"), str):
+        lic["expires_at"] = datetime.fromisoformat(lic["expires_at"])
+    return lic
+
+
 async def get_all_licenses_for_user(discord_id: str) -> List[Dict]:
-    """Get all licenses for a user."""
+    """Get all licenses for a user (expires_at parsed to datetime)."""
     pool = await get_pool()
     async with pool.acquire() as conn:
         rows = await conn.fetch(
             "SELECT * FROM licenses WHERE discord_id = $1 ORDER BY created_at DESC",
             discord_id
         )
-        return [dict(row) for row in rows]
+        return [_license_dict(row) for row in rows]
 
 
 async def revoke_license(license_key: str) -> bool:
@@ -342,7 +376,7 @@ async def extend_license(license_key: str, days: int) -> Optional[str]:
         current_expiry = row["expires_at"]
         if isinstance(current_expiry, str):
             current_expiry = datetime.fromisoformat(current_expiry)
-        now = datetime.utcnow()
+        now = utcnow()
 
         if days > 0:
             # If adding days and already expired, extend from now; otherwise extend from current expiry
@@ -375,10 +409,10 @@ async def extend_user_license(discord_id: str, days: int) -> Optional[str]:
 
 
 async def get_all_active_licenses(product: str = None) -> List[Dict]:
-    """Get all active (non-revoked, non-expired) licenses, optionally filtered by product."""
+    """Get all active (non-revoked, non-expired) licenses, optionally filtered by product (expires_at parsed to datetime)."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        now = datetime.utcnow()
+        now = utcnow()
         if product:
             rows = await conn.fetch(
                 """SELECT * FROM licenses
@@ -393,49 +427,29 @@ async def get_all_active_licenses(product: str = None) -> List[Dict]:
                    ORDER BY expires_at ASC""",
                 now
             )
-        return [dict(row) for row in rows]
+        return [_license_dict(row) for row in rows]
 
 
 async def get_license_stats(product: str = None) -> Dict:
     """Get license statistics, optionally filtered by product."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        now = datetime.utcnow()
-
-        if product:
-            total = await conn.fetchval(
-                "SELECT COUNT(*) FROM licenses WHERE product = $1", product
-            )
-            active = await conn.fetchval(
-                "SELECT COUNT(*) FROM licenses WHERE revoked = 0 AND expires_at > $1 AND product = $2",
-                now, product
-            )
-            revoked = await conn.fetchval(
-                "SELECT COUNT(*) FROM licenses WHERE revoked = 1 AND product = $1", product
-            )
-            expired = await conn.fetchval(
-                "SELECT COUNT(*) FROM licenses WHERE revoked = 0 AND expires_at <= $1 AND product = $2",
-                now, product
-            )
-        else:
-            total = await conn.fetchval("SELECT COUNT(*) FROM licenses")
-            active = await conn.fetchval(
-                "SELECT COUNT(*) FROM licenses WHERE revoked = 0 AND expires_at > $1",
-                now
-            )
-            revoked = await conn.fetchval(
-                "SELECT COUNT(*) FROM licenses WHERE revoked = 1"
-            )
-            expired = await conn.fetchval(
-                "SELECT COUNT(*) FROM licenses WHERE revoked = 0 AND expires_at <= $1",
-                now
-            )
+        # One scan with FILTER aggregates instead of four COUNT(*) round trips
+        row = await conn.fetchrow(
+            """SELECT COUNT(*) AS total,
+                      COUNT(*) FILTER (WHERE revoked = 0 AND expires_at > $1) AS active,
+                      COUNT(*) FILTER (WHERE revoked = 1) AS revoked,
+                      COUNT(*) FILTER (WHERE revoked = 0 AND expires_at <= $1) AS expired
+               FROM licenses
+               WHERE $2::text IS NULL OR product = $2""",
+            utcnow(), product
+        )
 
         return {
-            "total": total,
-            "active": active,
-            "revoked": revoked,
-            "expired": expired
+            "total": row["total"],
+            "active": row["active"],
+            "revoked": row["revoked"],
+            "expired": row["expired"]
         }
 
 
@@ -492,11 +506,11 @@ async def get_hwid_by_key(license_key: str) -> Optional[str]:
     return None
 
 
-async def get_newly_expired_licenses() -> List[Dict]:
-    """Get licenses that expired but haven't been notified yet."""
+async def get_newly_expired_licenses(now: Optional[datetime] = None) -> List[Dict]:
+    """Get licenses that expired as of `now` (default: current time) but haven't been notified yet."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        now = datetime.utcnow()
+        now = now or utcnow()
         rows = await conn.fetch(
             """SELECT * FROM licenses
                WHERE expires_at <= $1 AND revoked = 0 AND expiry_notified = 0""",
@@ -516,11 +530,24 @@ async def mark_expiry_notified(license_key: str) -> bool:
         return result != "UPDATE 0"
 
 
+async def mark_expiry_notified_bulk(license_keys: List[str]) -> int:
+    """Mark several licenses as notified about expiry in one statement. Returns rows updated."""
+    if not license_keys:
+        return 0
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            "UPDATE licenses SET expiry_notified = 1 WHERE license_key = ANY($1::text[])",
+            license_keys
+        )
+        return int(result.split()[-1]) if result else 0
+
+
 async def get_licenses_expiring_soon(days: int = 3) -> List[Dict]:
     """Get licenses expiring within the specified days that haven't been warned yet."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        now = datetime.utcnow()
+        now = utcnow()
         expiry_threshold = now + timedelta(days=days)
         rows = await conn.fetch(
             """SELECT * FROM licenses
@@ -547,7 +574,7 @@ async def has_active_license(discord_id: str) -> bool:
     """Check if a user has any active (non-expired, non-revoked) license."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        now = datetime.utcnow()
+        now = utcnow()
         count = await conn.fetchval(
             """SELECT COUNT(*) FROM licenses
                WHERE discord_id = $1 AND revoked = 0 AND expires_at > $2""",
@@ -560,7 +587,7 @@ async def has_active_license_for_product(discord_id: str, product: str) -> bool:
     """Check if a user has any active (non-expired, non-revoked) license for a specific product."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        now = datetime.utcnow()
+        now = utcnow()
         count = await conn.fetchval(
             """SELECT COUNT(*) FROM licenses
                WHERE discord_id = $1 AND product = $2 AND revoked = 0 AND expires_at > $3""",
@@ -569,6 +596,24 @@ async def has_active_license_for_product(discord_id: str, product: str) -> bool:
         return count > 0
 
 
+async def get_active_license_pairs(pairs: List[tuple]) -> set:
+    """Return the subset of (discord_id, product) pairs that still have an active license."""
+    if not pairs:
+        return set()
+    discord_ids, products = zip(*pairs)
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """SELECT DISTINCT l.discord_id, l.product
+               FROM licenses l
+               JOIN unnest($1::text[], $2::text[]) AS p(discord_id, product)
+                 ON l.discord_id = p.discord_id AND l.product = p.product
+               WHERE l.revoked = 0 AND l.expires_at > $3""",
+            list(discord_ids), list(products), utcnow()
+        )
+        return {(row["discord_id"], row["product"]) for row in rows}
+
+
 # ==================== SHOPIFY NOTIFICATIONS ====================
 
 async def init_notifications_table():
@@ -642,7 +687,7 @@ async def mark_notification_delivered(notification_id: int) -> bool:
             """UPDATE shopify_notifications
                SET delivered = 1, last_attempt_at = $1
                WHERE id = $2""",
-            datetime.utcnow(), notification_id
+            utcnow(), notification_id
         )
         return result != "UPDATE 0"
 
@@ -657,23 +702,72 @@ async def mark_notification_failed(notification_id: int, error: str = None) -> b
                    last_attempt_at = $1,
                    error_message = $2
                WHERE id = $3""",
-            datetime.utcnow(), error, notification_id
+            utcnow(), error, notification_id
         )
         return result != "UPDATE 0"
 
 
-async def get_failed_notifications() -> List[Dict]:
-    """Get notifications that failed to deliver after max attempts."""
+async def mark_notifications_delivered_bulk(notification_ids: List[int]) -> int:
+    """Mark several notifications as delivered in one query. Returns count updated."""
+    if not notification_ids:
+        return 0
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            """UPDATE shopify_notifications
+               SET delivered = 1, last_attempt_at = $1
+               WHERE id = ANY($2::int[])""",
+            utcnow(), notification_ids
+        )
+        # Parse "UPDATE N" to get count
+        return int(result.split()[-1]) if result else 0
+
+
+async def mark_notifications_failed_bulk(failures: List[tuple]) -> None:
+    """Mark several notification attempts as failed in one transaction. Takes (id, error) pairs."""
+    if not failures:
+        return
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        now = utcnow()
+        async with conn.transaction():
+            await conn.executemany(
+                """UPDATE shopify_notifications
+                   SET delivery_attempts = delivery_attempts + 1,
+                       last_attempt_at = $1,
+                       error_message = $2
+                   WHERE id = $3""",
+                [(now, error, notification_id) for notification_id, error in failures]
+            )
+
+
+async def get_failed_notifications(limit: int = None) -> List[Dict]:
+    """Get notifications that failed to deliver after max attempts (newest first, optionally limited)."""
     pool = await get_pool()
     async with pool.acquire() as conn:
         rows = await conn.fetch(
             """SELECT * FROM shopify_notifications
                WHERE delivered = 0 AND delivery_attempts >= 5
-               ORDER BY created_at DESC"""
+               ORDER BY created_at DESC
+               LIMIT $1""",
+            limit
         )
         return [dict(row) for row in rows]
 
 
+async def count_notifications() -> Dict:
+    """Count undelivered notifications: {"pending": still retrying, "failed": out of attempts}."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            """SELECT COUNT(*) FILTER (WHERE delivery_attempts < 5) AS pending,
+                      COUNT(*) FILTER (WHERE delivery_attempts >= 5) AS failed
+               FROM shopify_notifications
+               WHERE delivered = 0"""
+        )
+        return dict(row)
+
+
 # ==================== REFERRALS ====================
 
 async def init_referrals_table():
@@ -784,6 +878,104 @@ async def extend_user_license_for_product(discord_id: str, days: int, product: s
         return await extend_license(row["license_key"], days)
 
 
+async def _upsert_license_row(
+    conn: asyncpg.Connection,
+    license_key: str,
+    discord_id: str,
+    discord_name: str,
+    days: int,
+    product: str,
+    created_expires_at: datetime = None,
+    pending_days: int = None
+) -> Optional[asyncpg.Record]:
+    """Extend-or-create query behind upsert_license_extending, on a caller-supplied connection."""
+    return await conn.fetchrow(
+        """WITH target AS (
+               SELECT license_key FROM licenses
+               WHERE discord_id = $1 AND product = $2 AND revoked = 0
+               ORDER BY expires_at DESC LIMIT 1
+               FOR UPDATE
+           ),
+           extended AS (
+               UPDATE licenses l
+               SET expires_at = GREATEST(l.expires_at, $3) + make_interval(days => $4)
+               FROM target t
+               WHERE l.license_key = t.license_key
+               RETURNING l.expires_at
+           ),
+           created AS (
+               INSERT INTO licenses (license_key, discord_id, discord_name, expires_at, product, pending_days)
+               SELECT $5, $1, $6, COALESCE($7::timestamp, $3 + make_interval(days => $4)), $2, $8::int
+               WHERE NOT EXISTS (SELECT 1 FROM target)
+               RETURNING expires_at
+           )
+           SELECT expires_at, FALSE AS created FROM extended
+           UNION ALL
+           SELECT expires_at, TRUE AS created FROM created""",
+        discord_id, product, utcnow(), days, license_key, discord_name,
+        created_expires_at, pending_days
+    )
+
+
+async def upsert_license_extending(
+    license_key: str,
+    discord_id: str,
+    discord_name: str,
+    days: int,
+    product: str = "saints-gen",
+    created_expires_at: datetime = None,
+    pending_days: int = None
+) -> Optional[tuple]:
+    """Extend the user's newest active license for a product by `days`, or create one with
+    `license_key` if they have none. Single round-trip.
+
+    A created license expires `days` from now unless `created_expires_at` is given; set
+    `pending_days` to create it pending activation (see add_license).
+
+    Returns (expires_at, created) or None if the new key already exists.
+    """
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            row = await _upsert_license_row(
+                conn, license_key, discord_id, discord_name, days, product,
+                created_expires_at, pending_days
+            )
+        return (row["expires_at"], row["created"]) if row else None
+    except asyncpg.UniqueViolationError:
+        return None  # Key already exists
+
+
+async def claim_pending_order_with_license(
+    order_id: int,
+    license_key: str,
+    discord_id: str,
+    discord_name: str,
+    days: int,
+    product: str
+) -> Optional[tuple]:
+    """Claim a pending order and extend-or-create the user's license in one transaction.
+
+    Returns (expires_at, created), or None if the order was already claimed. Any failure
+    (including a license key collision) raises and rolls back, leaving the order unclaimed.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            result = await conn.execute(
+                """UPDATE pending_orders
+                   SET claimed = 1, claimed_by = $1, claimed_at = $2
+                   WHERE id = $3 AND claimed = 0""",
+                discord_id, utcnow(), order_id
+            )
+            if "UPDATE 1" not in result:
+                return None
+            row = await _upsert_license_row(conn, license_key, discord_id, discord_name, days, product)
+            if not row:
+                raise RuntimeError(f"License upsert returned no row for pending order {order_id}")
+            return row["expires_at"], row["created"]
+
+
 # ==================== PURCHASES (Email-based redemption) ====================
 
 async def init_purchases_table():
@@ -824,7 +1016,7 @@ async def add_purchase(
             """INSERT INTO purchases (email, customer_name, product, days, order_number)
                VALUES ($1, $2, $3, $4, $5)
                RETURNING id""",
-            email.lower().strip(), customer_name, product, days, order_number
+            normalize_email(email), customer_name, product, days, order_number
         )
         return row["id"]
 
@@ -836,36 +1028,36 @@ async def redeem_by_email(email: str, discord_id: str) -> Optional[Dict]:
     """
     pool = await get_pool()
     async with pool.acquire() as conn:
-        # Get unredeemed purchase for this email
+        # Find and mark the newest unredeemed purchase in one statement; emails are
+        # stored lowercased, so an exact match can use idx_purchases_email. SKIP LOCKED
+        # makes a concurrent retry of the same email find nothing instead of redeeming twice.
         row = await conn.fetchrow(
-            """SELECT * FROM purchases
-               WHERE LOWER(email) = LOWER($1) AND redeemed = 0
-               ORDER BY created_at DESC
-               LIMIT 1""",
-            email.strip()
+            """UPDATE purchases
+               SET redeemed = 1, redeemed_by = $2, redeemed_at = $3
+               WHERE id = (
+                   SELECT id FROM purchases
+                   WHERE email = $1 AND redeemed = 0
+                   ORDER BY created_at DESC
+                   LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+               )
+               RETURNING *""",
+            normalize_email(email), discord_id, utcnow()
         )
         if not row:
             return None
-
-        # Mark as redeemed
-        await conn.execute(
-            """UPDATE purchases
-               SET redeemed = 1, redeemed_by = $1, redeemed_at = $2
-               WHERE id = $3""",
-            discord_id, datetime.utcnow(), row["id"]
-        )
-
         return dict(row)
 
 
 async def cleanup_duplicate_licenses() -> Dict:
     """
     Find and delete duplicate licenses, keeping only the one with the most days remaining.
-    Returns stats about what was cleaned up.
+    Returns stats about what was cleaned up; each affected_users entry's kept_expiry is a
+    datetime, ready for display without re-parsing.
     """
     pool = await get_pool()
     async with pool.acquire() as conn:
-        now = datetime.utcnow()
+        now = utcnow()
 
         # Find all duplicates: users with more than 1 active license for the same product
         duplicates = await conn.fetch("""
@@ -895,7 +1087,7 @@ async def cleanup_duplicate_licenses() -> Dict:
                 continue
 
             # Keep the first one (highest expiry), delete the rest
-            to_keep = licenses[0]
+            to_keep = _license_dict(licenses[0])
             to_delete = licenses[1:]
 
             for lic in to_delete:
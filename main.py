@@ -20,7 +20,7 @@ def run_bot():
     """Run the Discord bot."""
     from bot import bot
     from config import DISCORD_TOKEN
-    bot.run(DISCORD_TOKEN)
+    bot.run(DISCORD_TOKEN, root_logger=True)
 
 
 if __name__ == "__main__":